@@ -0,0 +1,104 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class VersionedCache:
+    """
+    Кеш в общем для воркеров кеше Django с алиасом alias. Ключи
+    записей содержат текущую версию. Сигналы после коммита удаляют
+    её, и все процессы сразу переходят на новую; посчитанное до
+    сброса остаётся под старой версией и истекает через timeout.
+    """
+    def __init__(self, alias, prefix, timeout):
+        self.alias = alias
+        self.prefix = prefix
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def version_key(self):
+        return f'{self.prefix}:version'
+
+    def version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, uuid.uuid4().hex, timeout=None)
+            version = self.cache.get(self.version_key)
+        return version
+
+    def bump(self):
+        transaction.on_commit(lambda: self.cache.delete(self.version_key))
+
+    def get_or_set(self, key, default):
+        entry_key = f'{self.prefix}:{self.version()}:{digest(key)}'
+        value = self.cache.get(entry_key)
+        if value is None:
+            value = default()
+            self.cache.set(entry_key, value, timeout=self.timeout)
+        return value
+
+
+def digest(data):
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def etag_matches(request, etag):
+    """Проверка If-None-Match (слабое сравнение, как в RFC 7232)."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    for value in header.split(','):
+        value = value.strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        if value == etag:
+            return True
+    return False
+
+
+def modified_since(request, last_modified):
+    header = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    since = header and parse_http_date_safe(header)
+    return not since or int(last_modified.timestamp()) > since
+
+
+def make_etag(request, data_digest):
+    """Строгий ETag: отдельный для каждого формата ответа."""
+    return f'"{data_digest}-{request.accepted_renderer.format}"'
+
+
+def not_modified(etag, last_modified=None):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED,
+                        headers={'ETag': etag})
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def conditional_response(request, data, data_digest):
+    """
+    Ответ со строгим ETag; если клиент уже видел это представление,
+    отдаём 304 без тела.
+    """
+    etag = make_etag(request, data_digest)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return Response(data, headers={'ETag': etag})
+
+
+tag_cache = VersionedCache('responses', 'tags', settings.TAGS_CACHE_TIMEOUT)
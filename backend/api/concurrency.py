@@ -0,0 +1,99 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import counting
+
+query_executor = ThreadPoolExecutor(
+    max_workers=max(settings.DB_THREADS, 1), thread_name_prefix='db'
+)
+view_executor = ThreadPoolExecutor(
+    max_workers=max(settings.ASYNC_VIEW_THREADS, 1),
+    thread_name_prefix='view'
+)
+
+
+def counted(func):
+    with counting():
+        return func()
+
+
+def in_pool_thread(func):
+    """
+    Вызов в потоке пула: соединение потока живёт не дольше
+    CONN_MAX_AGE, как у обычного запроса.
+    """
+    close_old_connections()
+    try:
+        return counted(func)
+    finally:
+        close_old_connections()
+
+
+def submit(executor, func):
+    return executor.submit(
+        contextvars.copy_context().run, in_pool_thread, func
+    )
+
+
+def run_parallel(*funcs):
+    """
+    Выполняем независимые запросы одновременно, первый - в текущем
+    потоке. Внутри транзакции другие потоки не видят её данных,
+    поэтому там всё выполняется последовательно.
+    """
+    if settings.DB_THREADS < 1 or connection.in_atomic_block:
+        return [func() for func in funcs]
+    futures = [submit(query_executor, func) for func in funcs[1:]]
+    first = funcs[0]()
+    return [first] + [future.result() for future in futures]
+
+
+def close_pool_connections():
+    """
+    Закрываем постоянные соединения потоков пула запросов, например
+    перед удалением базы. Задачи ждут друг друга, поэтому каждая
+    выполняется в своём потоке.
+    """
+    workers = max(settings.DB_THREADS, 1)
+    barrier = threading.Barrier(workers)
+
+    def close():
+        barrier.wait()
+        connections.close_all()
+
+    wait([query_executor.submit(close) for _ in range(workers)])
+
+
+def async_view(view):
+    """
+    Асинхронная обёртка представления для ASGI. Чтение выполняется
+    в ограниченном пуле view_executor и не занимает поток цикла
+    событий, запись идёт обычным путём Django для синхронных views.
+    """
+    if not settings.ASYNC_VIEWS:
+        return view
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        call = functools.partial(view, request, *args, **kwargs)
+        if request.method not in SAFE_METHODS:
+            return await sync_to_async(counted)(call)
+        return await asyncio.wrap_future(submit(view_executor, call))
+
+    return wrapper
+
+
+def async_routes(patterns, names):
+    """Переводим маршруты с указанными именами на async_view."""
+    for pattern in patterns:
+        if getattr(pattern, 'name', None) in names:
+            pattern.callback = async_view(pattern.callback)
+    return patterns
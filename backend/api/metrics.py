@@ -0,0 +1,230 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from .middleware import ScopedMiddleware
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METHODS = ('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE')
+COUNTERS = {
+    'foodgram_response_cache_total': 'Обращения к кешу ответов анонимам.',
+}
+
+
+class Metrics:
+    """
+    Метрики процесса по маршрутам: гистограмма времени ответа,
+    число SQL-запросов и время в базе, а также счётчики COUNTERS.
+    Снимок периодически пишется в METRICS_DIR, чтобы /api/metrics/
+    собирал данные всех воркеров.
+    """
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.counters = {}
+        self.flushed = 0
+
+    def observe(self, route, method, seconds, queries, sql_seconds):
+        key = f'{route} {method}'
+        with self.lock:
+            stats = self.routes.setdefault(key, {
+                'buckets': [0] * len(BUCKETS),
+                'count': 0,
+                'sum': 0.0,
+                'queries': 0,
+                'sql_seconds': 0.0,
+            })
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][index] += 1
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['queries'] += queries
+            stats['sql_seconds'] += sql_seconds
+        self.maybe_flush()
+
+    def increment(self, name, **labels):
+        """Счётчик из COUNTERS, например increment(name, result='hit')."""
+        key = ','.join(
+            f'{label}="{value}"' for label, value in sorted(labels.items())
+        )
+        with self.lock:
+            counter = self.counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed >= self.flush_interval:
+            self.flush()
+
+    def path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        """Атомарно записываем снимок процесса в его файл."""
+        with self.lock:
+            self.flushed = time.monotonic()
+            data = json.dumps({
+                'routes': self.routes, 'counters': self.counters
+            })
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(os.getpid())
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as file:
+            file.write(data)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """Суммируем снимки всех процессов, включая текущий."""
+        self.flush()
+        total = {}
+        counters = {}
+        for path in glob.glob(self.path('*')):
+            try:
+                with open(path) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.get('counters', {}).items():
+                counter = counters.setdefault(name, {})
+                for key, value in values.items():
+                    counter[key] = counter.get(key, 0) + value
+            for key, stats in snapshot.get('routes', {}).items():
+                merged = total.setdefault(key, {
+                    'buckets': [0] * len(BUCKETS),
+                    'count': 0,
+                    'sum': 0.0,
+                    'queries': 0,
+                    'sql_seconds': 0.0,
+                })
+                merged['buckets'] = [
+                    a + b for a, b in zip(merged['buckets'], stats['buckets'])
+                ]
+                for field in ('count', 'sum', 'queries', 'sql_seconds'):
+                    merged[field] += stats[field]
+        return total, counters
+
+    def render(self):
+        """Текстовый формат Prometheus."""
+        lines = [
+            '# HELP foodgram_request_seconds Время ответа по маршрутам.',
+            '# TYPE foodgram_request_seconds histogram',
+        ]
+        total, counters = self.collect()
+        routes = sorted(total.items())
+        for key, stats in routes:
+            labels = self.labels(key)
+            for bound, value in zip(BUCKETS, stats['buckets']):
+                lines.append(
+                    f'foodgram_request_seconds_bucket'
+                    f'{{{labels},le="{bound}"}} {value}'
+                )
+            lines += [
+                f'foodgram_request_seconds_bucket{{{labels},le="+Inf"}} '
+                f'{stats["count"]}',
+                f'foodgram_request_seconds_sum{{{labels}}} {stats["sum"]}',
+                f'foodgram_request_seconds_count{{{labels}}} '
+                f'{stats["count"]}',
+            ]
+        for name, field, kind, help_text in (
+            ('foodgram_sql_queries_total', 'queries', 'counter',
+             'Число SQL-запросов по маршрутам.'),
+            ('foodgram_sql_seconds_total', 'sql_seconds', 'counter',
+             'Время SQL-запросов по маршрутам.'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for key, stats in routes:
+                lines.append(f'{name}{{{self.labels(key)}}} {stats[field]}')
+        for name, help_text in COUNTERS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for key, value in sorted(counters.get(name, {}).items()):
+                lines.append(f'{name}{{{key}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def labels(key):
+        route, method = key.split(' ')
+        return f'route="{route}",method="{method}"'
+
+
+metrics = Metrics(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+
+
+class QueryCounter:
+    """Обёртка execute: считает запросы и время в базе."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.queries += 1
+                self.seconds += time.perf_counter() - start
+
+
+request_queries = ContextVar('request_queries', default=None)
+
+
+@contextmanager
+def counting():
+    """
+    Подключаем счётчик текущего запроса к соединениям этого потока.
+    Нужен везде, где запрос обращается к базе из другого потока.
+    Уже подключённый счётчик второй раз не добавляется.
+    """
+    counter = request_queries.get()
+    with ExitStack() as stack:
+        if counter is not None:
+            for connection in connections.all():
+                if counter not in connection.execute_wrappers:
+                    stack.enter_context(connection.execute_wrapper(counter))
+        yield
+
+
+class MetricsMiddleware(ScopedMiddleware):
+    """
+    Замеряет каждый запрос и относит его к имени маршрута.
+    У потоковых ответов учитывается время до начала отдачи.
+    Работает и в синхронной, и в асинхронной цепочке. Счётчик,
+    заданный снаружи (команда benchmark), используется как есть.
+    """
+    @contextmanager
+    def scope(self, request):
+        counter = request_queries.get() or QueryCounter()
+        token = request_queries.set(counter)
+        try:
+            yield time.perf_counter(), counter
+        finally:
+            request_queries.reset(token)
+
+    def handle(self, request):
+        with counting():
+            return self.get_response(request)
+
+    def respond(self, request, response, state):
+        self.observe(request, *state)
+        return response
+
+    def observe(self, request, start, counter):
+        match = request.resolver_match
+        metrics.observe(
+            (match.url_name or match.view_name) if match else 'unmatched',
+            request.method if request.method in METHODS else 'OTHER',
+            time.perf_counter() - start,
+            counter.queries,
+            counter.seconds,
+        )
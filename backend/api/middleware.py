@@ -0,0 +1,40 @@
+import asyncio
+from contextlib import contextmanager
+
+
+class ScopedMiddleware:
+    """
+    Middleware для синхронной и асинхронной цепочки. Вызов
+    get_response оборачивается в scope(request), затем ответ
+    передаётся в respond вместе с тем, что отдал scope.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with self.scope(request) as state:
+            response = self.handle(request)
+        return self.respond(request, response, state)
+
+    async def __acall__(self, request):
+        with self.scope(request) as state:
+            response = await self.get_response(request)
+        return self.respond(request, response, state)
+
+    @contextmanager
+    def scope(self, request):
+        yield None
+
+    def handle(self, request):
+        """Синхронный вызов следующего звена."""
+        return self.get_response(request)
+
+    def respond(self, request, response, state):
+        return response
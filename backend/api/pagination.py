@@ -1,5 +1,39 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class OrderingCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация по сортировке самого queryset
+    (или Meta.ordering модели): следующая страница выбирается
+    условием по ключу сортировки, а не OFFSET.
+    """
+    page_size_query_param = 'limit'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return tuple(ordering)
 
 
 class CustomPaginator(PageNumberPagination):
+    """
+    Постраничная пагинация; с параметром ?cursor= (в том числе пустым)
+    переключается на курсорную. Готовые списки всегда делятся
+    на страницы по номеру.
+    """
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param in request.query_params
+                and hasattr(queryset, 'query')):
+            self.cursor_paginator = OrderingCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
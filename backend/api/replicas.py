@@ -0,0 +1,101 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .middleware import ScopedMiddleware
+
+STICKY_COOKIE = 'db_primary'
+
+
+class RoutingState:
+    """Реплика, выбранная для запроса; None - читаем с основной базы."""
+    alias = None
+
+
+routing = ContextVar('routing', default=None)
+
+
+@contextmanager
+def primary_reads():
+    """Чтение внутри блока идёт с основной базы, и в потоках пула тоже."""
+    state = routing.get()
+    if state is None:
+        yield
+        return
+    alias, state.alias = state.alias, None
+    try:
+        yield
+    finally:
+        state.alias = alias
+
+
+class ReplicaRouter:
+    """
+    Чтение идёт на реплику, только если её выбрал ReplicaMiddleware
+    и запрос не находится внутри транзакции. Запись и миграции -
+    всегда основная база.
+    """
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        if state is None or state.alias is None:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware(ScopedMiddleware):
+    """
+    GET-запросы к views с replica_reads = True читают с реплики.
+    После успешной записи клиент получает cookie, и следующие
+    REPLICA_STICKY_SECONDS его чтения идут на основную базу,
+    чтобы он видел собственные изменения.
+    """
+    @contextmanager
+    def scope(self, request):
+        token = routing.set(RoutingState())
+        try:
+            yield
+        finally:
+            routing.reset(token)
+
+    def respond(self, request, response, state):
+        return self.stick(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = routing.get()
+        view = getattr(view_func, 'cls', None)
+        if (
+            state is not None
+            and settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and getattr(view, 'replica_reads', False)
+            and STICKY_COOKIE not in request.COOKIES
+        ):
+            state.alias = random.choice(settings.DATABASE_REPLICAS)
+
+    def stick(self, request, response):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        ):
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,139 @@
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.core.cache import caches
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.commit_batch import CommitBatch
+
+from .caching import digest, etag_matches, modified_since, not_modified
+from .metrics import metrics
+
+HEADERS = ('ETag', 'Last-Modified')
+
+
+class ResponseCache:
+    """
+    Ответы анонимам в кеше Django с алиасом alias. Запись хранит
+    версии своих зависимостей - меток вида recipe:1, user:2 или
+    recipes:tag:breakfast. Сигналы сбрасывают версии изменённых
+    меток, и от записей, зависящих от них, при следующем чтении
+    отказываемся; остальные записи продолжают работать.
+    """
+    def __init__(self, alias):
+        self.alias = alias
+        self.bumps = CommitBatch(self.delete_versions)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def version_key(dependency):
+        return f'version:{digest(dependency)}'
+
+    def versions(self, dependencies):
+        """
+        Текущие версии меток. У новых меток заводим случайную версию
+        со временем создания: сброс удаляет метку, и по времени видно,
+        что её сбросили после начала построения ответа.
+        """
+        keys = [self.version_key(dependency) for dependency in dependencies]
+        found = self.cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                self.cache.add(
+                    key, (time.time(), uuid.uuid4().hex), timeout=None
+                )
+        return self.cache.get_many(keys)
+
+    def bump(self, *dependencies):
+        """
+        Сбрасываем версии после коммита: до него параллельный запрос
+        прочитал бы старые данные и сохранил их под новой версией.
+        Метки всей транзакции удаляются одним вызовом.
+        """
+        self.bumps.add(
+            self.version_key(dependency) for dependency in dependencies
+        )
+
+    def delete_versions(self, keys):
+        self.cache.delete_many(list(keys))
+
+    def clear(self):
+        self.cache.clear()
+
+    def key(self, request):
+        """Параметры запроса нормализуем: порядок не важен."""
+        query = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+        )
+        return 'entry:' + digest([
+            request.build_absolute_uri(request.path),
+            request.accepted_renderer.format,
+            query,
+        ])
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        versions, data, headers = entry
+        if self.cache.get_many(list(versions)) != versions:
+            return None
+        return data, headers
+
+    def respond(self, request, dependencies, build, data_dependencies):
+        """
+        Отдаём сохранённый ответ или строим его через build().
+        dependencies - метки, от которых зависит набор объектов
+        ответа; data_dependencies(data) добавляет метки объектов,
+        попавших в ответ. Ответ не сохраняем, если какую-то из его
+        меток сбросили, пока он строился: он мог прочитать данные
+        до изменения, а версии прочитал бы уже после.
+        """
+        key = self.key(request)
+        entry = self.get(key)
+        if entry is not None:
+            metrics.increment('foodgram_response_cache_total', result='hit')
+            return self.replay(request, *entry)
+        metrics.increment('foodgram_response_cache_total', result='miss')
+        self.versions(dependencies)
+        started = time.time()
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        dependencies = {*dependencies, *data_dependencies(response.data)}
+        versions = self.versions(dependencies)
+        if len(versions) == len(dependencies) and all(
+            created < started for created, _ in versions.values()
+        ):
+            headers = {
+                header: response[header]
+                for header in HEADERS if response.has_header(header)
+            }
+            self.cache.set(key, (versions, response.data, headers))
+        return response
+
+    @staticmethod
+    def replay(request, data, headers):
+        """Сохранённый ответ с теми же правилами 304, что у views."""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if last_modified:
+            last_modified = datetime.fromtimestamp(
+                parse_http_date_safe(last_modified), timezone.utc
+            )
+        if etag and etag_matches(request, etag) or (
+            last_modified and not request.META.get('HTTP_IF_NONE_MATCH')
+            and not modified_since(request, last_modified)
+        ):
+            return not_modified(etag, last_modified)
+        return Response(data, headers=headers)
+
+
+response_cache = ResponseCache('responses')
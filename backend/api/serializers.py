@@ -1,14 +1,19 @@
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.serializers import (ModelSerializer,
                                         ReadOnlyField)
 
+from recipes import shopping_list
+from recipes.coverage_index import coverage_index
+from recipes.images import variant_urls
 from recipes.models import (Ingredient, IngredientRecipe, Recipe,
                             Tag)
 from users.serializers import CustomUserSerializer
 
+from .user_state import get_user_state
+
 MIN_VALUE = 1
 MAX_VALUE = 32000
 
@@ -44,6 +49,7 @@ class IngredientRecipeSerializer(ModelSerializer):
 class RecipeSerializer(ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
     ingredients = IngredientRecipeSerializer(
         source='ingredientrecipe',
         many=True,
@@ -69,22 +75,34 @@ class RecipeSerializer(ModelSerializer):
                   'is_in_shopping_cart',
                   'name',
                   'image',
+                  'image_variants',
                   'text',
-                  'cooking_time')
+                  'cooking_time',
+                  'favorites_count',
+                  'in_carts_count')
+        read_only_fields = ('favorites_count', 'in_carts_count')
         model = Recipe
 
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        return {
+            variant: {
+                extension: request.build_absolute_uri(url)
+                for extension, url in urls.items()
+            }
+            for variant, urls in variant_urls(obj).items()
+        }
+
     def get_is_favorited(self, obj):
         request = self.context.get('request')
-        user = request.user
         return (request.user.is_authenticated
-                and user.favorite.filter(recipe=obj).exists()
+                and obj.id in get_user_state(request).favorite_ids
                 )
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
-        user = request.user
         return (request.user.is_authenticated
-                and user.shopping_cart.filter(recipe=obj).exists()
+                and obj.id in get_user_state(request).cart_ids
                 )
 
     def recipe_check(self, user, request_method, recipe):
@@ -106,29 +124,52 @@ class RecipeSerializer(ModelSerializer):
             )
         return unique_tags
 
+    @staticmethod
+    def numbers(ingredients, field, message):
+        try:
+            return [int(item[field]) for item in ingredients]
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError(message)
+
     def ingredients_check(self, ingredients):
+        """
+        Все ингредиенты загружаются одним запросом, отсутствующие
+        перечисляются в одной ошибке. Возвращаем список с объектами
+        Ingredient, который затем использует ingredientsrecipe_create.
+        """
         if not ingredients:
             raise serializers.ValidationError(
                 'Блюдо должно содержать хотя бы 1 ингредиент!')
+        ids = self.numbers(
+            ingredients, 'id', 'У каждого ингредиента должен быть числовой id!'
+        )
+        amounts = self.numbers(
+            ingredients, 'amount',
+            'У каждого ингредиента должно быть числовое количество!'
+        )
+        found = Ingredient.objects.in_bulk(ids)
+        missing = [str(pk) for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {", ".join(missing)}')
+        checked = []
         ingredients_set = set()
-        for item in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient,
-                id=item['id']
-            )
+        for pk, amount in zip(ids, amounts):
+            ingredient = found[pk]
             if ingredient in ingredients_set:
                 raise serializers.ValidationError(
                     f'Ингредиент {ingredient.name} уже добавлен!')
             ingredients_set.add(ingredient)
-            if int(item['amount']) < MIN_VALUE:
+            if amount < MIN_VALUE:
                 raise serializers.ValidationError(
                     f'Количество ингредиента {ingredient.name} < {MIN_VALUE}'
                 )
-            if int(item['amount']) > MAX_VALUE:
+            if amount > MAX_VALUE:
                 raise serializers.ValidationError(
                     f'Количество ингредиента {ingredient.name} > {MAX_VALUE}'
                 )
-        return ingredients
+            checked.append({'ingredient': ingredient, 'amount': amount})
+        return checked
 
     def validate(self, data):
         user = self.context.get('request').user
@@ -146,12 +187,47 @@ class RecipeSerializer(ModelSerializer):
     def ingredientsrecipe_create(self, ingredients, recipe):
         IngredientRecipe.objects.bulk_create(
             [IngredientRecipe(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient=ingredient['ingredient'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def ingredientsrecipe_update(self, ingredients, recipe):
+        """
+        Сравниваем текущий состав рецепта с новым и трогаем только
+        изменившиеся строки. Возвращаем старые и новые количества.
+        """
+        existing = {
+            row.ingredient_id: row for row in recipe.ingredientrecipe.all()
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in existing.items()
+        }
+        new_amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients
+        }
+        removed = existing.keys() - new_amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        added = [item for item in ingredients
+                 if item['ingredient'].id not in existing]
+        if added:
+            self.ingredientsrecipe_create(added, recipe)
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -162,19 +238,31 @@ class RecipeSerializer(ModelSerializer):
         )
         new_recipe.tags.set(tags)
         self.ingredientsrecipe_create(ingredients, new_recipe)
+        self.update_coverage_index(
+            new_recipe, [item['ingredient'].id for item in ingredients]
+        )
         return new_recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        shopping_list.lock_recipe(instance.id)
         ingredients = validated_data.pop('ingredients')
-        instance = super().update(instance, validated_data)
         tags = validated_data.pop('tags')
-        instance.tags.clear()
+        instance = super().update(instance, validated_data)
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.ingredientsrecipe_create(ingredients, instance)
-        instance.save()
+        old_amounts, new_amounts = self.ingredientsrecipe_update(
+            ingredients, instance
+        )
+        shopping_list.update_recipe(instance.id, old_amounts, new_amounts)
+        self.update_coverage_index(instance, new_amounts)
         return instance
 
+    def update_coverage_index(self, recipe, ingredient_ids):
+        ingredient_ids = list(ingredient_ids)
+        transaction.on_commit(
+            lambda: coverage_index.update(recipe.id, ingredient_ids)
+        )
+
 
 class SubscribeCartSerializer(serializers.ModelSerializer):
 
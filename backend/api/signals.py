@@ -0,0 +1,99 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes.images import variants_ready
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag, TagsRecipes)
+from users.models import User, login_only
+
+from .caching import tag_cache
+from .response_cache import response_cache
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_cache(**kwargs):
+    tag_cache.bump()
+
+
+def tag_lists(slugs):
+    return [f'recipes:tag:{slug}' for slug in slugs]
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_saved_recipe(instance, **kwargs):
+    response_cache.bump(
+        f'recipe:{instance.id}', 'recipes',
+        f'recipes:author:{instance.author_id}'
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def invalidate_deleted_recipe(instance, **kwargs):
+    response_cache.bump(
+        f'recipe:{instance.id}', 'recipes',
+        f'recipes:author:{instance.author_id}',
+        *tag_lists(instance.tags.values_list('slug', flat=True))
+    )
+
+
+@receiver(variants_ready, sender=Recipe)
+def invalidate_recipe_images(recipe_id, **kwargs):
+    response_cache.bump(f'recipe:{recipe_id}')
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    response_cache.bump(f'recipe:{instance.recipe_id}')
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_recipe_counters(instance, **kwargs):
+    response_cache.bump(f'recipe:{instance.recipe_id}', 'recipes:counters')
+
+
+@receiver((post_save, post_delete), sender=TagsRecipes)
+def invalidate_tag_recipe(instance, **kwargs):
+    response_cache.bump(
+        f'recipe:{instance.recipes_id}', *tag_lists([instance.tags.slug])
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_retagged_recipes(instance, action, reverse, pk_set, **kwargs):
+    """Снятые и добавленные теги меняют состав списков по тегам."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        recipes = pk_set
+        if pk_set is None:
+            recipes = instance.recipes.values_list('id', flat=True)
+        slugs = [instance.slug]
+    else:
+        recipes = [instance.pk]
+        tags = instance.tags
+        if pk_set is not None:
+            tags = Tag.objects.filter(id__in=pk_set)
+        slugs = tags.values_list('slug', flat=True)
+    response_cache.bump(
+        *(f'recipe:{recipe}' for recipe in recipes), *tag_lists(slugs)
+    )
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_responses(instance, **kwargs):
+    response_cache.bump(f'tag:{instance.id}', *tag_lists([instance.slug]))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_responses(instance, **kwargs):
+    response_cache.bump(f'ingredient:{instance.id}')
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_author_responses(instance, update_fields=None, **kwargs):
+    """Вход пользователя не учитываем."""
+    if login_only(update_fields):
+        return
+    response_cache.bump(f'user:{instance.id}')
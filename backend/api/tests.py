@@ -0,0 +1,463 @@
+import threading
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import (TestCase, TransactionTestCase,
+                         skipUnlessDBFeature)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes import shopping_list
+from recipes.images import VARIANTS
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscriptions, User
+
+from .caching import tag_cache
+from .response_cache import response_cache
+
+RECIPES = 10
+
+
+class RecipeQueriesTest(TestCase):
+    """Число запросов к рецептам не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Автор', last_name='Рецептов'
+        )
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass',
+            first_name='Читатель', last_name='Рецептов'
+        )
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag-{i}')
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        for i in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Текст',
+                image='recipes/test.png', cooking_time=10
+            )
+            recipe.tags.set(tags)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=10)
+                for ingredient in ingredients
+            )
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscriptions.objects.create(user=cls.user, author=cls.author)
+        cls.recipe = recipe
+
+    def setUp(self):
+        response_cache.clear()
+        self.anonymous = APIClient()
+        self.authorized = APIClient()
+        self.authorized.force_authenticate(self.user)
+
+    def assert_queries(self, client, url, number):
+        with self.assertNumQueries(number):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_anonymous(self):
+        for limit in (2, RECIPES):
+            with self.subTest(limit=limit):
+                response = self.assert_queries(
+                    self.anonymous, f'/api/recipes/?limit={limit}', 5
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_authorized(self):
+        for limit in (2, RECIPES):
+            with self.subTest(limit=limit):
+                response = self.assert_queries(
+                    self.authorized, f'/api/recipes/?limit={limit}', 8
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail_anonymous(self):
+        self.assert_queries(
+            self.anonymous, f'/api/recipes/{self.recipe.id}/', 4
+        )
+
+    def test_detail_authorized(self):
+        response = self.assert_queries(
+            self.authorized, f'/api/recipes/{self.recipe.id}/', 7
+        )
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+
+class RecipeUpdateTest(TransactionTestCase):
+    """
+    Замена состава пишет в рецепт и поисковый индекс по разу. Нужны
+    настоящие коммиты: индекс обновляется в on_commit.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Автор', last_name='Рецептов'
+        )
+        self.tag = Tag.objects.create(
+            name='Тег', color='#000000', slug='tag'
+        )
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(2 * RECIPES)
+        ]
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='recipes/test.png', cooking_time=10,
+            image_variants={
+                'source': 'recipes/test.png',
+                **{variant: {} for variant in VARIANTS}
+            }
+        )
+        self.recipe.tags.set([self.tag])
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=self.recipe, ingredient=ingredient,
+                             amount=10)
+            for ingredient in self.ingredients[:RECIPES]
+        )
+
+    def test_replace_ingredients(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.patch(f'/api/recipes/{self.recipe.id}/', {
+                'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+                'tags': [self.tag.id],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 5}
+                    for ingredient in self.ingredients[RECIPES:]
+                ],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        statements = [query['sql'] for query in queries]
+        for prefix in ('UPDATE "recipes_recipe"',
+                       'DELETE FROM "recipes_recipesearchterm"'):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    sum(sql.startswith(prefix) for sql in statements), 1
+                )
+        self.assertEqual(
+            set(self.recipe.ingredients.values_list('id', flat=True)),
+            {ingredient.id for ingredient in self.ingredients[RECIPES:]}
+        )
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ShoppingListRaceTest(TransactionTestCase):
+    """
+    Рецепт добавляют в корзину, пока правка его состава не закоммичена:
+    список покупок должен получить новый состав, а не старый.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Автор', last_name='Рецептов'
+        )
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass',
+            first_name='Читатель', last_name='Рецептов'
+        )
+        self.tag = Tag.objects.create(
+            name='Тег', color='#000000', slug='tag'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='recipes/test.png', cooking_time=10,
+            image_variants={
+                'source': 'recipes/test.png',
+                **{variant: {} for variant in VARIANTS}
+            }
+        )
+        self.recipe.tags.set([self.tag])
+        IngredientRecipe.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=10
+        )
+
+    def request(self, user, method, url, data=None):
+        try:
+            client = APIClient()
+            client.force_authenticate(user)
+            return getattr(client, method)(url, data, format='json')
+        finally:
+            connection.close()
+
+    def interleave(self, add):
+        """
+        Правка состава останавливается после update_recipe, до
+        коммита; в это время в другом потоке выполняется add.
+        """
+        edited = threading.Event()
+        commit = threading.Event()
+        update_recipe = shopping_list.update_recipe
+        responses = {}
+
+        def paused_update(*args):
+            update_recipe(*args)
+            edited.set()
+            commit.wait(5)
+
+        def edit():
+            responses['edit'] = self.request(
+                self.author, 'patch', f'/api/recipes/{self.recipe.id}/', {
+                    'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+                    'tags': [self.tag.id],
+                    'ingredients': [{'id': self.ingredient.id, 'amount': 20}],
+                }
+            )
+
+        with mock.patch.object(shopping_list, 'update_recipe', paused_update):
+            editor = threading.Thread(target=edit)
+            editor.start()
+            self.assertTrue(edited.wait(5))
+            adder = threading.Thread(target=add)
+            adder.start()
+            adder.join(0.5)
+            commit.set()
+            editor.join()
+            adder.join()
+        self.assertEqual(responses['edit'].status_code, 200)
+        self.assertEqual(
+            shopping_list.stored_totals([self.reader.id]),
+            {(self.reader.id, self.ingredient.id): 20}
+        )
+
+    def test_add_to_cart_during_edit(self):
+        responses = {}
+
+        def add():
+            responses['add'] = self.request(
+                self.reader, 'post',
+                f'/api/recipes/{self.recipe.id}/shopping_cart/'
+            )
+
+        self.interleave(add)
+        self.assertEqual(responses['add'].status_code, 201)
+
+    def test_add_recipe_during_edit(self):
+        """
+        Строка корзины без сигнала счётчика: его UPDATE рецепта тоже
+        ждёт правку, но список покупок не должен на это полагаться.
+        """
+        def add():
+            try:
+                with transaction.atomic():
+                    ShoppingCart.objects.bulk_create([
+                        ShoppingCart(user=self.reader, recipe=self.recipe)
+                    ])
+                    shopping_list.add_recipe(self.reader.id, self.recipe.id)
+            finally:
+                connection.close()
+
+        self.interleave(add)
+
+
+class ResponseCacheTest(TransactionTestCase):
+    """Ответы анонимам из кеша сбрасываются только своими изменениями."""
+
+    def setUp(self):
+        response_cache.clear()
+        self.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Автор', last_name='Рецептов'
+        )
+        self.other = User.objects.create_user(
+            username='other', email='other@foodgram.ru', password='pass',
+            first_name='Другой', last_name='Автор'
+        )
+        self.breakfast = Tag.objects.create(
+            name='Завтрак', color='#000000', slug='breakfast'
+        )
+        self.dinner = Tag.objects.create(
+            name='Ужин', color='#ffffff', slug='dinner'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        self.recipe = self.create_recipe(self.author, self.breakfast)
+        self.other_recipe = self.create_recipe(self.other, self.dinner)
+        self.anonymous = APIClient()
+
+    def create_recipe(self, author, tag):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {author.username}', text='Текст',
+            image='recipes/test.png', cooking_time=10,
+            image_variants={
+                'source': 'recipes/test.png',
+                **{variant: {} for variant in VARIANTS}
+            }
+        )
+        recipe.tags.set([tag])
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=self.ingredient, amount=10
+        )
+        return recipe
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.anonymous.get(url)
+        return response, len(queries)
+
+    def warm(self, *urls):
+        """Первые промахи заводят версии меток, дальше - попадание."""
+        for url in urls:
+            for _ in range(3):
+                response, queries = self.get(url)
+                if not queries:
+                    break
+            self.assertEqual(queries, 0, url)
+
+    def edit(self, recipe, name):
+        client = APIClient()
+        client.force_authenticate(recipe.author)
+        response = client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': name, 'text': 'Текст', 'cooking_time': 10,
+            'tags': list(recipe.tags.values_list('id', flat=True)),
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def names(self, url):
+        return [recipe['name'] for recipe in self.get(url)[0].data['results']]
+
+    def test_edit(self):
+        detail = f'/api/recipes/{self.recipe.id}/'
+        self.warm(detail, '/api/recipes/')
+        self.edit(self.recipe, 'Новое имя')
+        self.assertEqual(self.get(detail)[0].data['name'], 'Новое имя')
+        self.assertIn('Новое имя', self.names('/api/recipes/'))
+
+    def test_delete(self):
+        self.warm('/api/recipes/', '/api/recipes/?tags=breakfast')
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.delete(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.names('/api/recipes/'), ['Рецепт other'])
+        self.assertEqual(self.names('/api/recipes/?tags=breakfast'), [])
+        response, _ = self.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_counter_change(self):
+        detail = f'/api/recipes/{self.other_recipe.id}/'
+        ordered = '/api/recipes/?ordering=-favorites_count'
+        self.warm(detail, ordered)
+        Favorite.objects.create(user=self.author, recipe=self.other_recipe)
+        self.assertEqual(self.get(detail)[0].data['favorites_count'], 1)
+        self.assertEqual(self.names(ordered)[0], 'Рецепт other')
+
+    def test_author_filter(self):
+        url = f'/api/recipes/?author={self.author.id}'
+        self.warm(url)
+        self.edit(self.other_recipe, 'Чужая правка')
+        self.assertEqual(self.get(url)[1], 0)
+        self.edit(self.recipe, 'Своя правка')
+        self.assertEqual(self.names(url), ['Своя правка'])
+
+    def test_tag_edit(self):
+        detail = f'/api/recipes/{self.recipe.id}/'
+        self.warm(detail, '/api/recipes/?tags=dinner')
+        self.breakfast.name = 'Поздний завтрак'
+        self.breakfast.save()
+        self.assertEqual(
+            self.get(detail)[0].data['tags'][0]['name'], 'Поздний завтрак'
+        )
+        self.assertEqual(self.get('/api/recipes/?tags=dinner')[1], 0)
+
+
+class TagCacheTest(TransactionTestCase):
+    """Теги отдаются из общего кеша и сбрасываются после коммита."""
+
+    def setUp(self):
+        tag_cache.cache.clear()
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#000000', slug='breakfast'
+        )
+        self.client = APIClient()
+
+    def test_rename(self):
+        self.assertEqual(self.client.get('/api/tags/').data[0]['name'],
+                         'Завтрак')
+        with self.assertNumQueries(0):
+            etag = self.client.get('/api/tags/')['ETag']
+        self.tag.name = 'Обед'
+        self.tag.save()
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.data[0]['name'], 'Обед')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_delete(self):
+        url = f'/api/tags/{self.tag.id}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.tag.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class CursorPaginationTest(TestCase):
+    """Курсор не сдвигается от рецептов, добавленных между страницами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Автор', last_name='Рецептов'
+        )
+        cls.recipes = [cls.create_recipe(i) for i in range(5)]
+
+    @classmethod
+    def create_recipe(cls, number):
+        return Recipe.objects.create(
+            author=cls.author, name=f'Рецепт {number}', text='Текст',
+            image='recipes/test.png', cooking_time=10,
+            image_variants={
+                'source': 'recipes/test.png',
+                **{variant: {} for variant in VARIANTS}
+            }
+        ).id
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def read(self, url, insert):
+        """Читаем страницы по ссылкам next, добавляя рецепты после первой."""
+        ids, inserted = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+            if len(ids) == 2:
+                inserted = [self.create_recipe(10 + i) for i in range(insert)]
+        return ids, inserted
+
+    def test_newest_first(self):
+        ids, _ = self.read('/api/recipes/?cursor=&limit=2', 3)
+        self.assertEqual(ids, sorted(self.recipes, reverse=True))
+
+    def test_ascending_reaches_new_recipes(self):
+        ids, inserted = self.read(
+            '/api/recipes/?cursor=&limit=2&ordering=id', 3
+        )
+        self.assertEqual(ids, self.recipes + inserted)
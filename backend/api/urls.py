@@ -1,7 +1,9 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+from .concurrency import async_routes
+from .views import (IngredientViewSet, MetricsView, RecipeViewSet,
+                    TagViewSet)
 
 router = DefaultRouter()
 router.register(
@@ -17,6 +19,10 @@ router.register(
 )
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include('users.urls')),
-    path('', include(router.urls)),
+    path('', include(async_routes(router.urls, (
+        'recipe-list', 'recipe-detail', 'tag-list', 'tag-detail',
+        'ingredient-list', 'ingredient-detail',
+    )))),
 ]
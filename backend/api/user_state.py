@@ -0,0 +1,53 @@
+from django.utils.functional import cached_property
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscriptions
+
+
+class UserState:
+    """
+    Избранное, список покупок и подписки пользователя.
+    Каждое множество загружается одним запросом при первом обращении
+    и живёт до конца запроса.
+    """
+    def __init__(self, user):
+        self.user = user
+
+    def ids(self, queryset, field):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(
+            queryset.filter(user=self.user).order_by()
+            .values_list(field, flat=True)
+        )
+
+    def loaders(self):
+        """Загрузчики множеств для run_parallel; анониму не нужны."""
+        if not self.user.is_authenticated:
+            return []
+        return [
+            lambda: self.favorite_ids,
+            lambda: self.cart_ids,
+            lambda: self.following_ids,
+        ]
+
+    @cached_property
+    def favorite_ids(self):
+        return self.ids(Favorite.objects, 'recipe_id')
+
+    @cached_property
+    def cart_ids(self):
+        return self.ids(ShoppingCart.objects, 'recipe_id')
+
+    @cached_property
+    def following_ids(self):
+        return self.ids(Subscriptions.objects, 'author_id')
+
+
+def get_user_state(request):
+    """UserState, общий для всех сериализаторов одного запроса."""
+    http_request = getattr(request, '_request', request)
+    state = getattr(http_request, 'user_state', None)
+    if state is None or state.user.pk != request.user.pk:
+        state = http_request.user_state = UserState(request.user)
+    return state
@@ -1,31 +1,54 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from functools import partial
+
+from django.db import transaction
+from django.db.models import (Count, Exists, Max, OuterRef, Prefetch,
+                              prefetch_related_objects)
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import http_date
 from rest_framework import filters, status
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes import shopping_list
+from recipes.coverage_index import coverage_index
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart, Tag)
+from recipes.search import search
+from users.models import Subscriptions
 
+from .caching import (conditional_response, digest, etag_matches,
+                      make_etag, modified_since, not_modified, tag_cache)
+from .concurrency import run_parallel
+from .metrics import metrics
 from .pagination import CustomPaginator
 from .permissions import CustomPermission, IsAdminOrReadOnly
+from .replicas import primary_reads
+from .response_cache import response_cache
 from .serializers import (IngredientSerializer, RecipeSerializer,
                           SubscribeCartSerializer, TagSerializer)
+from .user_state import get_user_state
 
 
 class IngredientViewSet(ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
     permission_classes = (IsAuthenticatedOrReadOnly,)
     lookup_field = 'id'
     http_method_names = ['get']
     pagination_class = None
+    replica_reads = True
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение отдаётся из индекса в памяти процесса."""
+        name = request.query_params.get(api_settings.SEARCH_PARAM, '')
+        return Response(ingredient_index.search(name))
 
 
 class TagViewSet(ModelViewSet):
@@ -35,6 +58,25 @@ class TagViewSet(ModelViewSet):
     lookup_field = 'id'
     http_method_names = ['get']
     pagination_class = None
+    replica_reads = True
+
+    def list(self, request, *args, **kwargs):
+        return self.cached('list', lambda: self.get_serializer(
+            self.get_queryset(), many=True
+        ).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(('detail', kwargs['id']), lambda: (
+            self.get_serializer(self.get_object()).data
+        ))
+
+    def cached(self, key, serialize):
+        """Теги отдаются из общего кеша с ETag и ответом 304."""
+        def build():
+            data = serialize()
+            return data, digest(data)
+        data, data_digest = tag_cache.get_or_set(key, build)
+        return conditional_response(self.request, data, data_digest)
 
 
 class RecipeViewSet(ModelViewSet):
@@ -43,10 +85,15 @@ class RecipeViewSet(ModelViewSet):
     permission_classes = (CustomPermission, )
     http_method_names = ['get', 'post', 'patch', 'delete']
     lookup_field = 'id'
+    replica_reads = True
     pagination_class = CustomPaginator
+    filter_backends = (filters.OrderingFilter,)
+    ordering_fields = ('favorites_count', 'in_carts_count', 'id')
 
     def get_queryset(self):
-        queryset = self.queryset
+        return self.with_related(self.filter_recipes(self.queryset))
+
+    def filter_recipes(self, queryset):
         tags = self.request.query_params.getlist('tags')
         if tags:
             queryset = queryset.filter(
@@ -55,6 +102,9 @@ class RecipeViewSet(ModelViewSet):
         author = self.request.query_params.get('author')
         if author:
             queryset = queryset.filter(author=author)
+        query = self.request.query_params.get('search')
+        if query:
+            queryset = search(queryset, query)
         user = self.request.user
         if user.is_anonymous:
             return queryset
@@ -72,9 +122,190 @@ class RecipeViewSet(ModelViewSet):
             queryset = queryset.exclude(favorite__user=user.id)
         return queryset
 
+    def related_lookups(self):
+        return (
+            'tags',
+            Prefetch(
+                'ingredientrecipe',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
+    def with_related(self, queryset):
+        """
+        Подгружаем всё, что нужно RecipeSerializer, фиксированным
+        числом запросов: автора, теги и ингредиенты. Флаги пользователя
+        берутся из get_user_state.
+        """
+        return queryset.select_related('author').prefetch_related(
+            *self.related_lookups()
+        )
+
+    def prefetch(self, recipes):
+        """Теги и ингредиенты страницы подгружаются параллельно."""
+        for recipe in recipes:
+            recipe._prefetched_objects_cache = {}
+        run_parallel(*(
+            partial(prefetch_related_objects, recipes, lookup)
+            for lookup in self.related_lookups()
+        ))
+
+    def cached(self, request, dependencies, build):
+        """
+        Ответы анонимам берутся из response_cache. Промах строим по
+        основной базе: отстающая реплика после сброса версий отдала бы
+        старые строки, и они сохранились бы под новыми версиями.
+        """
+        if request.user.is_authenticated:
+            return build()
+        return response_cache.respond(
+            request, dependencies, partial(self.from_primary, build),
+            self.data_dependencies
+        )
+
+    @staticmethod
+    def from_primary(build):
+        with primary_reads():
+            return build()
+
+    @staticmethod
+    def data_dependencies(data):
+        """Метки рецептов ответа, их авторов, тегов и ингредиентов."""
+        if isinstance(data, dict):
+            data = data.get('results', [data])
+        dependencies = set()
+        for recipe in data:
+            dependencies.add(f'recipe:{recipe["id"]}')
+            if recipe['author']:
+                dependencies.add(f'user:{recipe["author"]["id"]}')
+            dependencies.update(f'tag:{tag["id"]}' for tag in recipe['tags'])
+            dependencies.update(
+                f'ingredient:{ingredient["id"]}'
+                for ingredient in recipe['ingredients']
+            )
+        return dependencies
+
+    def list_dependencies(self, request):
+        """
+        От чего зависит состав анонимного списка: фильтр по автору -
+        от рецептов автора, по тегам - от рецептов с этими тегами,
+        остальные запросы - от всех рецептов, сортировка - ещё и
+        от счётчиков.
+        """
+        params = request.query_params
+        dependencies = {
+            f'recipes:tag:{slug}' for slug in params.getlist('tags')
+        }
+        if params.get('author'):
+            dependencies.add(f'recipes:author:{params["author"]}')
+        if not dependencies or set(params) - {
+            'tags', 'author', 'page', 'limit'
+        }:
+            dependencies.add('recipes')
+        if api_settings.ORDERING_PARAM in params:
+            dependencies.add('recipes:counters')
+        return dependencies
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(
+            request, self.list_dependencies(request),
+            partial(self.list_response, request)
+        )
+
+    def list_response(self, request):
+        """
+        ETag списка считается по последнему изменению и числу
+        отфильтрованных рецептов, параметрам запроса и состоянию
+        избранного, списка покупок и подписок пользователя. Те же
+        множества затем использует сериализатор. Независимые запросы
+        выполняются параллельно через run_parallel.
+        """
+        state = get_user_state(request)
+        summary, *_ = run_parallel(
+            lambda: self.filter_recipes(self.queryset).order_by().aggregate(
+                last=Max('updated_at'), count=Count('id')
+            ),
+            *state.loaders()
+        )
+        etag = make_etag(request, digest([
+            summary, request.GET.urlencode(), request.user.id,
+            sorted(state.favorite_ids), sorted(state.cart_ids),
+            sorted(state.following_ids),
+        ]))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        queryset = self.filter_queryset(
+            self.get_queryset()
+        ).prefetch_related(None)
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+        self.prefetch(recipes)
+        serializer = self.get_serializer(recipes, many=True)
+        if page is None:
+            response = Response(serializer.data)
+        else:
+            response = self.get_paginated_response(serializer.data)
+        response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(
+            request, {f'recipe:{kwargs["id"]}'},
+            partial(self.retrieve_response, request, *args, **kwargs)
+        )
+
+    def retrieve_response(self, request, *args, **kwargs):
+        """
+        Валидаторы рецепта одним запросом: дата изменения и флаги
+        пользователя. Last-Modified отдаём только анонимам, у них
+        ответ не зависит от флагов.
+        """
+        user = request.user
+        queryset = self.filter_recipes(self.queryset).filter(id=kwargs['id'])
+        fields = ['updated_at']
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                in_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                subscribed=Exists(Subscriptions.objects.filter(
+                    user=user, author=OuterRef('author')
+                )),
+            )
+            fields += ['favorited', 'in_cart', 'subscribed']
+        state = queryset.values_list(*fields).first()
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag(request, digest([state, user.id]))
+        last_modified = None if user.is_authenticated else state[0]
+        if etag_matches(request, etag) or (
+            last_modified and not request.META.get('HTTP_IF_NONE_MATCH')
+            and not modified_since(request, last_modified)
+        ):
+            return not_modified(etag, last_modified)
+        response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
     def perform_create(self, serializer):
         author = self.request.user
         serializer.save(author=author)
+        serializer.instance = self.reload(serializer.instance)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        serializer.instance = self.reload(serializer.instance)
+
+    def reload(self, recipe):
+        """Перечитываем рецепт для ответа с уже подгруженными связями."""
+        return self.with_related(Recipe.objects.all()).get(id=recipe.id)
 
     def add_model(self, model, request, id):
         user = self.request.user
@@ -112,10 +343,72 @@ class RecipeViewSet(ModelViewSet):
         detail=True,
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, id):
         if request.method == 'POST':
-            return self.add_model(ShoppingCart, request, id)
-        return self.remove_model(ShoppingCart, request.user, id)
+            response = self.add_model(ShoppingCart, request, id)
+            shopping_list.add_recipe(request.user.id, id)
+            return response
+        response = self.remove_model(ShoppingCart, request.user, id)
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            shopping_list.remove_recipe(request.user.id, id)
+        return response
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """Новые рецепты авторов из подписок, самые свежие сверху."""
+        entries = FeedEntry.objects.filter(
+            user=request.user
+        ).order_by('-recipe_id').values('recipe_id')
+        page = self.paginate_queryset(entries)
+        recipes = self.with_related(Recipe.objects.all()).in_bulk(
+            [entry['recipe_id'] for entry in page]
+        )
+        serializer = self.get_serializer(
+            [recipes[entry['recipe_id']] for entry in page
+             if entry['recipe_id'] in recipes],
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['GET'],
+        detail=False,
+    )
+    def cook(self, request):
+        """
+        Что приготовить из имеющихся продуктов (?ingredients=1,2
+        или ?ingredients=1&ingredients=2): рецепты с долей имеющихся
+        ингредиентов coverage и числом недостающих missing.
+        """
+        try:
+            ingredient_ids = {
+                int(value)
+                for param in request.query_params.getlist('ingredients')
+                for value in param.split(',') if value
+            }
+        except ValueError:
+            return Response({'errors': 'id ингредиентов должны быть числами'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not ingredient_ids:
+            return Response({'errors': 'Укажите хотя бы один ингредиент'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(coverage_index.query(ingredient_ids))
+        recipes = self.with_related(Recipe.objects.all()).in_bulk(
+            [recipe_id for _, _, recipe_id in page]
+        )
+        data = []
+        for coverage, missing, recipe_id in page:
+            if recipe_id in recipes:
+                item = self.get_serializer(recipes[recipe_id]).data
+                item['coverage'] = round(coverage, 3)
+                item['missing'] = missing
+                data.append(item)
+        return self.get_paginated_response(data)
 
     @action(
         methods=['GET'],
@@ -123,22 +416,35 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
+        """
+        Список покупок отдаётся потоком в формате из параметра type:
+        txt (по умолчанию), csv или json.
+        """
+        file_type = request.query_params.get('type', 'txt')
+        renderers = shopping_list.RENDERERS
+        if file_type not in renderers:
+            return Response(
+                {'errors': f'Доступные форматы: {", ".join(renderers)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        render, content_type = renderers[file_type]
         user = request.user
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_cart__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        filename = f'{user}_cart.txt'
-        final_list = []
-        for i in ingredients:
-            final_list.append(f'{i["ingredient__name"]}'
-                              f' - {i["amount"]}'
-                              f' {i["ingredient__measurement_unit"]}'
-                              )
-        file = HttpResponse('Cписок покупок:\n' + '\n'.join(final_list),
-                            content_type='application.txt')
+        filename = f'{user}_cart.{file_type}'
+        file = StreamingHttpResponse(
+            render(shopping_list.get_shopping_list(user)),
+            content_type=content_type
+        )
         file['Content-Disposition'] = (
             f'attachment; filename={filename}')
         return file
+
+
+class MetricsView(APIView):
+    """Метрики всех воркеров в формате Prometheus, только для staff."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
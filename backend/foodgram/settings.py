@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,9 +70,28 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', default=0)),
     }
 }
+
+# Реплики для чтения: DB_REPLICA_HOSTS="host[:port],host[:port]"
+DATABASE_REPLICAS = []
+for address in filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica{len(DATABASE_REPLICAS) + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Сколько секунд после записи чтения клиента идут на основную базу
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=10))
 # DATABASES = {
 #    'default': {
 #        'ENGINE': 'django.db.backends.sqlite3',
@@ -113,6 +134,9 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Потоки для нарезки изображений рецептов; 0 - обработка в запросе
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
@@ -124,7 +148,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'SEARCH_PARAM': 'name',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -132,6 +156,80 @@ REST_FRAMEWORK = {
 }
 
 
+# Сколько последних рецептов автора попадает в ленту при подписке
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', default=100))
+
+# Кеш токенов авторизации в памяти процесса
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', default=60))
+# Версии токенов в файлах, общих для воркеров: отзыв токена сразу
+# виден всем процессам. Несколько серверов должны делить этот каталог
+TOKEN_VERSIONS_DIR = os.getenv(
+    'TOKEN_VERSIONS_DIR', default='/tmp/foodgram-tokens'
+)
+
+# Сколько секунд живут записи кеша тегов; он общий для воркеров и
+# хранится вместе с кешем ответов в RESPONSE_CACHE_DIR
+TAGS_CACHE_TIMEOUT = int(os.getenv('TAGS_CACHE_TIMEOUT', default=60))
+
+# Кеш ответов анонимам на /api/recipes/ в файлах, общих для
+# воркеров: сброс после записи сразу виден всем процессам. Несколько
+# серверов должны делить этот каталог. Записи живут не дольше
+# RESPONSE_CACHE_TIMEOUT секунд; 0 - выключен
+RESPONSE_CACHE_DIR = os.getenv(
+    'RESPONSE_CACHE_DIR', default='/tmp/foodgram-responses'
+)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': TOKEN_VERSIONS_DIR,
+        'OPTIONS': {'MAX_ENTRIES': TOKEN_CACHE_SIZE},
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': RESPONSE_CACHE_DIR,
+        'TIMEOUT': RESPONSE_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_SIZE', default=10000)),
+        },
+    },
+}
+
+# Через сколько секунд индекс ингредиентов перечитывается из базы
+INGREDIENTS_INDEX_TIMEOUT = int(
+    os.getenv('INGREDIENTS_INDEX_TIMEOUT', default=300)
+)
+
+# Индекс «что приготовить» сверяется с базой не чаще раза в
+# COVERAGE_SYNC_INTERVAL секунд и строится заново раз в
+# COVERAGE_INDEX_TIMEOUT секунд
+COVERAGE_SYNC_INTERVAL = int(os.getenv('COVERAGE_SYNC_INTERVAL', default=1))
+COVERAGE_INDEX_TIMEOUT = int(
+    os.getenv('COVERAGE_INDEX_TIMEOUT', default=300)
+)
+
+# Каталог, куда воркеры сбрасывают свои метрики, и период сброса
+METRICS_DIR = os.getenv('METRICS_DIR', default='/tmp/foodgram-metrics')
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', default=5))
+
+# ASGI: чтение выполняется асинхронными views в пуле из
+# ASYNC_VIEW_THREADS потоков; включается в foodgram/asgi.py
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default='0') == '1'
+ASYNC_VIEW_THREADS = int(os.getenv('ASYNC_VIEW_THREADS', default=16))
+
+# Потоки для параллельных запросов к базе внутри одного запроса;
+# 0 - всё последовательно. Без CONN_MAX_AGE каждый поток открывает
+# новое соединение на задачу, поэтому по умолчанию пул включён только
+# в режиме ASGI с постоянными соединениями
+DB_THREADS = int(os.getenv(
+    'DB_THREADS',
+    default=4 if ASYNC_VIEWS and DATABASES['default']['CONN_MAX_AGE'] else 0
+))
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "HIDE_USERS": False,
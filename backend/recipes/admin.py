@@ -1,29 +1,98 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
 
+from . import shopping_list
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                      ShoppingCart, Tag, TagsRecipes)
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Для большой таблицы без фильтров в PostgreSQL число строк
+    берётся из статистики pg_class вместо COUNT(*).
+    """
+    threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.threshold:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class ShoppingListRebuildMixin:
+    """
+    Правки из админки идут мимо инкрементального обновления
+    ShoppingListItem, поэтому списки затронутых пользователей
+    пересобираются целиком.
+    """
+    def affected_users(self, queryset):
+        return set(ShoppingCart.objects.filter(
+            recipe__in=queryset.values('recipe')
+        ).values_list('user_id', flat=True))
+
+    def save_model(self, request, obj, form, change):
+        queryset = self.model.objects.filter(pk=obj.pk)
+        users = self.affected_users(queryset) if change else set()
+        super().save_model(request, obj, form, change)
+        users |= self.affected_users(queryset)
+        transaction.on_commit(lambda: shopping_list.rebuild(users))
+
+    def delete_model(self, request, obj):
+        users = self.affected_users(self.model.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+        transaction.on_commit(lambda: shopping_list.rebuild(users))
+
+    def delete_queryset(self, request, queryset):
+        users = self.affected_users(queryset)
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(lambda: shopping_list.rebuild(users))
+
+
 class IngredientRecipeInline(admin.StackedInline):
     model = IngredientRecipe
     min_num = 1
+    extra = 0
+    autocomplete_fields = ('ingredient',)
 
 
 class TagRecipeInline(admin.TabularInline):
     model = TagsRecipes
     min_num = 1
+    extra = 0
 
 
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdmin):
     list_display = ('name',
                     'measurement_unit',
                     )
+    list_filter = ('measurement_unit',)
+    search_fields = ('^name',)
 
 
-class TagsRecipesAdmin(admin.ModelAdmin):
+class TagsRecipesAdmin(LargeTableAdmin):
     list_display = ('recipes',
                     'tags',
                     )
+    list_select_related = ('recipes', 'tags')
+    list_filter = ('tags',)
+    autocomplete_fields = ('recipes',)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -33,33 +102,55 @@ class TagAdmin(admin.ModelAdmin):
                     )
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     list_display = ('name',
                     'author',
+                    'favorites_count',
                     )
-    list_filter = ('name', 'author',
-                   ('tags', admin.RelatedOnlyFieldListFilter),)
+    list_select_related = ('author',)
+    list_filter = (('tags', admin.RelatedOnlyFieldListFilter),)
+    search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
     inlines = (IngredientRecipeInline, TagRecipeInline)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        users = set(ShoppingCart.objects.filter(
+            recipe=form.instance
+        ).values_list('user_id', flat=True))
+        transaction.on_commit(lambda: shopping_list.rebuild(users))
 
-class IngredientRecipeAdmin(admin.ModelAdmin):
+
+class IngredientRecipeAdmin(ShoppingListRebuildMixin, LargeTableAdmin):
     list_display = ('recipe',
                     'ingredient',
                     'amount',
                     )
-    list_filter = ('ingredient',)
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', '^ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('recipe',
                     'user',
                     )
+    list_select_related = ('recipe', 'user')
+    search_fields = ('recipe__name', 'user__username')
+    autocomplete_fields = ('recipe', 'user')
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(ShoppingListRebuildMixin, LargeTableAdmin):
     list_display = ('recipe',
                     'user',
                     )
+    list_select_related = ('recipe', 'user')
+    search_fields = ('recipe__name', 'user__username')
+    autocomplete_fields = ('recipe', 'user')
+
+    def affected_users(self, queryset):
+        return set(queryset.values_list('user_id', flat=True))
 
 
 admin.site.register(Ingredient, IngredientAdmin)
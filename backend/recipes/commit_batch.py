@@ -0,0 +1,46 @@
+from django.db import transaction
+
+
+class Pending:
+    """Ключи одной транзакции; вызывается один раз после коммита."""
+    def __init__(self, batch):
+        self.batch = batch
+        self.keys = set()
+
+    def __call__(self):
+        self.batch.flush(self.keys)
+
+
+class CommitBatch:
+    """
+    Собираем ключи за транзакцию и передаём их flush одним вызовом
+    после коммита. Сигналы на каждую строку сводятся к одной работе
+    на объект. Вне транзакции flush вызывается сразу.
+    """
+    def __init__(self, flush):
+        self.flush = flush
+
+    def add(self, keys):
+        """
+        Добавляем ключи и возвращаем те, что в транзакции новые.
+        Ключи хранятся в on_commit своей точки сохранения: её откат
+        убирает их вместе с записью, и они снова считаются новыми.
+        """
+        keys = set(keys)
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            if keys:
+                self.flush(keys)
+            return keys
+        current = None
+        for savepoints, callback, *_ in connection.run_on_commit:
+            if getattr(callback, 'batch', None) is self:
+                keys -= callback.keys
+                if savepoints == set(connection.savepoint_ids):
+                    current = callback
+        if keys and current is None:
+            current = Pending(self)
+            transaction.on_commit(current)
+        if keys:
+            current.keys |= keys
+        return keys
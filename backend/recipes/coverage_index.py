@@ -0,0 +1,161 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import IngredientRecipe, Recipe
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+class CoverageIndex:
+    """
+    Индекс «что приготовить»: для каждого рецепта битовая маска
+    его ингредиентов. Запрос - пересечение маски продуктов
+    пользователя с масками всех рецептов.
+    Не чаще раза в sync_interval секунд индекс сверяется с базой
+    одним агрегатом: рецепты с новым updated_at перечитываются,
+    отсутствующие в индексе загружаются по id, удалённые
+    выбрасываются. Правку, закоммиченную позже чужой сверки, по
+    updated_at не увидеть, поэтому раз в timeout секунд индекс
+    строится заново. Запросы к базе идут без блокировки индекса.
+    """
+    def __init__(self, sync_interval, timeout):
+        self.sync_interval = sync_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._bits = {}
+        self._masks = {}
+        self._updated = {}
+        self._synced_at = None
+        self._checked = None
+        self._built = None
+
+    def _mask(self, ingredient_ids, create=False):
+        mask = 0
+        for ingredient_id in ingredient_ids:
+            bit = self._bits.get(ingredient_id)
+            if bit is None:
+                if not create:
+                    continue
+                bit = self._bits[ingredient_id] = len(self._bits)
+            mask |= 1 << bit
+        return mask
+
+    @staticmethod
+    def _load(recipe_ids=None):
+        """Составы рецептов: всех или из recipe_ids."""
+        rows = IngredientRecipe.objects.all()
+        if recipe_ids is not None:
+            rows = rows.filter(recipe__in=recipe_ids)
+        compositions = {recipe_id: [] for recipe_id in recipe_ids or ()}
+        for recipe_id, ingredient_id in rows.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by().iterator():
+            compositions.setdefault(recipe_id, []).append(ingredient_id)
+        return compositions
+
+    def _set(self, compositions):
+        for recipe_id, ingredient_ids in compositions.items():
+            mask = self._mask(ingredient_ids, create=True)
+            self._masks[recipe_id] = (mask, popcount(mask))
+
+    def update(self, recipe_id, ingredient_ids):
+        """
+        Состав рецепта после коммита в этом процессе. Его помним до
+        конца сверки, чтобы она не вернула прочитанный раньше состав.
+        """
+        ingredient_ids = list(ingredient_ids)
+        with self._lock:
+            self._updated[recipe_id] = ingredient_ids
+            self._set({recipe_id: ingredient_ids})
+
+    @staticmethod
+    def due(last, interval):
+        return last is None or time.monotonic() - last >= interval
+
+    def refresh(self):
+        if not self.due(self._checked, self.sync_interval):
+            return
+        if not self._refresh_lock.acquire(blocking=self._built is None):
+            return
+        try:
+            if not self.due(self._checked, self.sync_interval):
+                return
+            with self._lock:
+                self._updated = {}
+            if self.due(self._built, self.timeout):
+                self._rebuild()
+            else:
+                self._sync()
+            self._checked = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def _rebuild(self):
+        state = Recipe.objects.aggregate(last=Max('updated_at'))
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        compositions = self._load()
+        with self._lock:
+            self._bits, self._masks = {}, {}
+            self._set({
+                recipe_id: compositions.get(recipe_id, ())
+                for recipe_id in recipe_ids
+            })
+            self._set(self._updated)
+            self._synced_at = state['last']
+        self._built = time.monotonic()
+
+    def _sync(self):
+        state = Recipe.objects.aggregate(
+            last=Max('updated_at'), count=Count('id')
+        )
+        changed = set()
+        if state['last'] is not None and (
+            self._synced_at is None or state['last'] > self._synced_at
+        ):
+            recipes = Recipe.objects.all()
+            if self._synced_at is not None:
+                recipes = recipes.filter(updated_at__gte=self._synced_at)
+            changed.update(recipes.values_list('id', flat=True))
+        with self._lock:
+            known = set(self._masks)
+        deleted = set()
+        if state['count'] != len(known | changed):
+            existing = set(Recipe.objects.values_list('id', flat=True))
+            changed |= existing - known
+            deleted = known - existing
+        compositions = self._load(changed) if changed else {}
+        with self._lock:
+            self._set(compositions)
+            for recipe_id in deleted - self._updated.keys():
+                self._masks.pop(recipe_id, None)
+            self._set(self._updated)
+            self._synced_at = state['last']
+
+    def query(self, ingredient_ids):
+        """
+        Рецепты, где есть хотя бы один из продуктов, как кортежи
+        (доля имеющихся ингредиентов, сколько не хватает, id рецепта):
+        сначала с большей долей, затем с меньшим числом недостающих.
+        """
+        self.refresh()
+        with self._lock:
+            have = self._mask(ingredient_ids)
+            masks = list(self._masks.items())
+        ranked = []
+        for recipe_id, (mask, total) in masks:
+            matched = popcount(mask & have)
+            if matched:
+                ranked.append((matched / total, total - matched, recipe_id))
+        ranked.sort(key=lambda item: (-item[0], item[1], -item[2]))
+        return ranked
+
+
+coverage_index = CoverageIndex(
+    settings.COVERAGE_SYNC_INTERVAL, settings.COVERAGE_INDEX_TIMEOUT
+)
@@ -0,0 +1,41 @@
+from django.conf import settings
+
+from users.models import Subscriptions
+
+from .models import FeedEntry, Recipe
+
+BATCH_SIZE = 1000
+
+
+def fan_out(recipe):
+    """Новый рецепт попадает в ленты всех подписчиков автора."""
+    followers = Subscriptions.objects.filter(
+        author=recipe.author_id
+    ).values_list('user_id', flat=True).iterator()
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, author_id=recipe.author_id,
+                   recipe=recipe)
+         for user_id in followers),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    """При подписке в ленту добавляются последние рецепты автора."""
+    recipes = Recipe.objects.filter(
+        author=author_id
+    ).order_by('-id').values_list(
+        'id', flat=True
+    )[:settings.FEED_BACKFILL_LIMIT]
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, author_id=author_id,
+                   recipe_id=recipe_id)
+         for recipe_id in recipes),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def prune(user_id, author_id):
+    FeedEntry.objects.filter(user=user_id, author=author_id).delete()
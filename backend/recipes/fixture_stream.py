@@ -0,0 +1,145 @@
+import json
+import re
+
+from django.apps import apps
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.serializers.python import Deserializer
+from django.core.serializers.python import Serializer as PythonSerializer
+
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_array_start(file):
+    """Пропускаем пробелы до '[' и возвращаем уже прочитанный остаток."""
+    buffer = ''
+    while not buffer:
+        chunk = file.read(CHUNK_SIZE)
+        buffer = chunk.lstrip()
+        if not chunk:
+            break
+    if not buffer.startswith('['):
+        raise ValueError('Фикстура должна быть JSON-массивом')
+    return buffer[1:]
+
+
+def decode_buffer(decoder, buffer):
+    """
+    Отдаём целые объекты из buffer. Возвращаем позицию недочитанного
+    хвоста и ошибку его разбора или (None, None), если массив закрыт.
+    """
+    position = 0
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if position == len(buffer):
+            return position, None
+        if buffer[position] == ']':
+            return None, None
+        try:
+            obj, position = decoder.raw_decode(buffer, position)
+        except ValueError as error:
+            return position, error
+        yield obj
+
+
+def iter_objects(file):
+    """
+    Читаем JSON-массив фикстуры по частям: объекты разбираются
+    raw_decode по мере поступления, весь файл в память не попадает.
+    """
+    decoder = json.JSONDecoder()
+    buffer = read_array_start(file)
+    while True:
+        position, error = yield from decode_buffer(decoder, buffer)
+        if position is None:
+            return
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            raise error or ValueError('Фикстура оборвалась до конца массива')
+        buffer = buffer[position:] + chunk
+
+
+def deserialize(file):
+    """DeserializedObject для каждого объекта фикстуры, лениво."""
+    return Deserializer(
+        iter_objects(file), ignorenonexistent=True,
+        handle_forward_references=True
+    )
+
+
+def sorted_models(labels=(), exclude=()):
+    """
+    Модели в порядке зависимостей, как в dumpdata. Метки сравниваются
+    без учёта регистра: auth.permission и auth.Permission - одно и то же.
+    """
+    labels = {label.lower() for label in labels}
+    exclude = {label.lower() for label in exclude}
+    app_list = {}
+    for app_config in apps.get_app_configs():
+        for model in app_config.get_models():
+            meta = model._meta
+            if meta.proxy or not meta.managed:
+                continue
+            names = {meta.app_label.lower(), meta.label_lower}
+            if labels and not names & labels:
+                continue
+            if names & exclude:
+                continue
+            app_list.setdefault(app_config, []).append(model)
+    return serializers.sort_dependencies(app_list.items(), allow_cycles=True)
+
+
+def m2m_fields(model):
+    """Поля many-to-many без собственной модели-связки."""
+    return [
+        field for field in model._meta.many_to_many
+        if field.remote_field.through._meta.auto_created
+    ]
+
+
+class ChunkSerializer(PythonSerializer):
+    """Сериализатор пачки, m2m берутся из заранее выбранных связей."""
+    def __init__(self, m2m):
+        self.m2m = m2m
+
+    def handle_m2m_field(self, obj, field):
+        if field.name in self.m2m:
+            self._current[field.name] = self.m2m[field.name].get(obj.pk, [])
+
+
+def serialize_chunk(model, objects):
+    """Словари в формате dumpdata: m2m одной выборкой на пачку."""
+    pks = [obj.pk for obj in objects]
+    m2m = {}
+    for field in m2m_fields(model):
+        related = m2m[field.name] = {}
+        for source, target in field.remote_field.through.objects.filter(**{
+            f'{field.m2m_field_name()}__in': pks
+        }).values_list(
+            field.m2m_field_name(), field.m2m_reverse_field_name()
+        ).order_by(field.m2m_reverse_field_name()):
+            related.setdefault(source, []).append(target)
+    return ChunkSerializer(m2m).serialize(objects)
+
+
+def dump(stream, models, batch_size):
+    """Пишем модели в stream одним JSON-массивом, пачками по pk."""
+    stream.write('[')
+    first = True
+    for model in models:
+        queryset = model._default_manager.order_by('pk')
+        last = None
+        while True:
+            page = queryset if last is None else queryset.filter(pk__gt=last)
+            objects = list(page[:batch_size])
+            if not objects:
+                break
+            last = objects[-1].pk
+            for data in serialize_chunk(model, objects):
+                if not first:
+                    stream.write(',\n')
+                first = False
+                json.dump(data, stream, cls=DjangoJSONEncoder,
+                          ensure_ascii=False)
+    stream.write(']\n')
@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Варианты изображения записаны в рецепт; аргумент recipe_id
+variants_ready = Signal()
+
+VARIANTS = {
+    'card': 480,
+    'detail': 1024,
+    'full': None,
+}
+FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+QUALITY = 82
+
+executor = ThreadPoolExecutor(
+    max_workers=max(settings.IMAGE_WORKERS, 1),
+    thread_name_prefix='recipe-images',
+)
+
+
+def variant_name(image_name, variant, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'recipes/variants/{stem}_{variant}.{extension}'
+
+
+def delete_image_files(image_name, variants):
+    """
+    Удаляем исходное изображение и его варианты, если ни один рецепт
+    больше на него не ссылается.
+    """
+    if not image_name or Recipe.objects.filter(image=image_name).exists():
+        return
+    names = {image_name}
+    for variant in VARIANTS:
+        names.update((variants.get(variant) or {}).values())
+    for name in names:
+        default_storage.delete(name)
+
+
+def build_variants(recipe_id, image_name):
+    """
+    Уменьшенные копии изображения рецепта в WebP и JPEG.
+    Результат записывается в Recipe.image_variants, только если
+    за это время у рецепта не сменилось изображение. После коммита
+    удаляются файлы вытесненного изображения: прежнего, если наше
+    записано, или нашего, если рецепт успел сменить его или удалиться.
+    """
+    try:
+        with default_storage.open(image_name) as file:
+            source = ImageOps.exif_transpose(Image.open(file))
+            source = source.convert('RGB')
+        variants = {'source': image_name}
+        for variant, size in VARIANTS.items():
+            image = source.copy()
+            if size:
+                image.thumbnail((size, size), Image.LANCZOS)
+            variants[variant] = {}
+            for extension, image_format in FORMATS.items():
+                buffer = BytesIO()
+                image.save(buffer, image_format, quality=QUALITY)
+                name = variant_name(image_name, variant, extension)
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                variants[variant][extension] = default_storage.save(
+                    name, ContentFile(buffer.getvalue())
+                )
+        with transaction.atomic():
+            previous = Recipe.objects.select_for_update().filter(
+                id=recipe_id, image=image_name
+            ).values_list('image_variants', flat=True).first()
+            if previous is None:
+                superseded = (image_name, variants)
+            else:
+                Recipe.objects.filter(id=recipe_id).update(
+                    image_variants=variants, updated_at=timezone.now()
+                )
+                superseded = (previous.get('source'), previous)
+            transaction.on_commit(lambda: delete_image_files(*superseded))
+        if previous is not None:
+            variants_ready.send(sender=Recipe, recipe_id=recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', image_name)
+
+
+def build_variants_in_worker(recipe_id, image_name):
+    try:
+        build_variants(recipe_id, image_name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe):
+    """
+    Ставим обработку изображения в очередь после коммита.
+    При IMAGE_WORKERS = 0 обработка идёт в текущем потоке.
+    """
+    recipe_id, image_name = recipe.id, recipe.image.name
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: executor.submit(
+                build_variants_in_worker, recipe_id, image_name
+            )
+        )
+    else:
+        transaction.on_commit(
+            lambda: build_variants(recipe_id, image_name)
+        )
+
+
+def wait_for_variants():
+    """
+    Ждём, пока пул допишет уже поставленные варианты: пустые задачи
+    на каждый поток выполняются одновременно, только когда все
+    потоки свободны.
+    """
+    workers = max(settings.IMAGE_WORKERS, 1)
+    barrier = threading.Barrier(workers)
+    wait([executor.submit(barrier.wait) for _ in range(workers)])
+
+
+def variant_urls(recipe):
+    """Ссылки на готовые варианты или пустой словарь, пока их нет."""
+    variants = recipe.image_variants or {}
+    if variants.get('source') != recipe.image.name:
+        return {}
+    return {
+        variant: {
+            extension: default_storage.url(name)
+            for extension, name in variants[variant].items()
+        }
+        for variant in VARIANTS
+    }
@@ -0,0 +1,70 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Ingredient
+
+
+class IngredientPrefixIndex:
+    """
+    Индекс ингредиентов для автодополнения.
+    Хранит отсортированные названия в нижнем регистре (casefold)
+    и отвечает на запросы без обращения к базе.
+    Строится лениво при первом запросе, сбрасывается сигналами
+    сохранения и удаления Ingredient. Изменения из других процессов
+    (например, basefill) подхватываются через timeout секунд.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._expires = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._items = None
+
+    def _load(self):
+        with self._lock:
+            if self._keys is None or self._expires < time.monotonic():
+                entries = sorted(
+                    (name.casefold(), pk, name, measurement_unit)
+                    for pk, name, measurement_unit
+                    in Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit'
+                    ).iterator()
+                )
+                self._keys = [entry[0] for entry in entries]
+                self._items = [
+                    {'id': pk, 'name': name,
+                     'measurement_unit': measurement_unit}
+                    for _, pk, name, measurement_unit in entries
+                ]
+                self._expires = time.monotonic() + self.timeout
+            return self._keys, self._items
+
+    def search(self, query):
+        """
+        Сначала ингредиенты, название которых начинается с query,
+        затем те, где query встречается внутри названия.
+        """
+        keys, items = self._load()
+        query = query.strip().casefold()
+        if not query:
+            return list(items)
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        substring = [
+            items[i] for i, key in enumerate(keys)
+            if (i < start or i >= end) and query in key
+        ]
+        return items[start:end] + substring
+
+
+ingredient_index = IngredientPrefixIndex(settings.INGREDIENTS_INDEX_TIMEOUT)
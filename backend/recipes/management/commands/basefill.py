@@ -1,27 +1,85 @@
 import csv
-# import os
+import io
+import time
+from itertools import islice
 
 from django.core.management import BaseCommand
+from django.db import connection, transaction
 from recipes.models import Ingredient
 
-# FILES_DIR = os.path.dirname(os.path.dirname(os.getcwd()))
+HEADER = ['name', 'measurement_unit']
 
 
 class Command(BaseCommand):
     help = "import data from ingredients.csv"
 
-    def handle(self, *args, **kwargs):
-        # with open(f'{FILES_DIR}/foodgram-project-react/data/ingredients.csv',
-        #           'r', encoding='utf-8') as file:
-        with open('recipes/data/ingredients.csv',
-                  'r', encoding='utf-8') as file:
-            file_reader = csv.reader(file)
-            next(file_reader)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='recipes/data/ingredients.csv',
+            help='CSV file with name,measurement_unit rows',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows read and inserted per batch',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Insert with PostgreSQL COPY instead of bulk_create',
+        )
 
-            for row in file_reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
+    def handle(self, *args, **options):
+        use_copy = options['copy'] and connection.vendor == 'postgresql'
+        if options['copy'] and not use_copy:
+            self.stdout.write('COPY недоступен, используется bulk_create')
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+            .iterator()
+        )
+        started = time.monotonic()
+        processed = inserted = 0
+        with open(options['path'], 'r', encoding='utf-8') as file:
+            file_reader = csv.reader(file)
+            while True:
+                chunk = list(islice(file_reader, options['batch_size']))
+                if not chunk:
+                    break
+                if processed == 0 and chunk[0] == HEADER:
+                    chunk = chunk[1:]
+                processed += len(chunk)
+                new = []
+                for row in chunk:
+                    key = tuple(value.strip() for value in row[:2])
+                    if len(key) == 2 and all(key) and key not in existing:
+                        existing.add(key)
+                        new.append(key)
+                with transaction.atomic():
+                    if use_copy:
+                        self.copy(new)
+                    else:
+                        Ingredient.objects.bulk_create(
+                            Ingredient(name=name,
+                                       measurement_unit=measurement_unit)
+                            for name, measurement_unit in new
+                        )
+                inserted += len(new)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Обработано {processed}, добавлено {inserted}, '
+                    f'{processed / elapsed:.0f} строк/с'
                 )
         self.stdout.write(self.style.SUCCESS('Ингредиенты добавлены'))
+
+    def copy(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {Ingredient._meta.db_table} (name, measurement_unit) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
@@ -0,0 +1,383 @@
+import json
+import random
+import shutil
+import tempfile
+import time
+from contextlib import ExitStack
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.concurrency import close_pool_connections
+from api.metrics import QueryCounter, counting, request_queries
+from api.response_cache import response_cache
+from recipes import feed, images
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag, TagsRecipes)
+from users.models import Subscriptions, User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+BATCH_SIZE = 1000
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def percentile(values, rank):
+    """Процентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * rank // 100) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Seeds synthetic data and measures API latency and query counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument(
+            '--favorites', type=int, default=10,
+            help='Favorites per user',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Shopping cart recipes per user',
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=5,
+            help='Followed authors per user',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Requests per scenario',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--path',
+            default='recipes/data/ingredients.csv',
+            help='CSV file with ingredients',
+        )
+        parser.add_argument('--output', help='Write the report to a file')
+        parser.add_argument(
+            '--baseline',
+            help='Compare with a previously saved report',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Allowed relative p95 growth against the baseline',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help=(
+                'Seed the configured database and keep the data; by '
+                'default a throwaway test database is created'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        with ExitStack() as stack:
+            if not options['keep']:
+                self.throwaway_database(stack)
+            self.seed()
+            report = self.run()
+        if options['keep']:
+            response_cache.clear()
+        data = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(data)
+        else:
+            self.stdout.write(data)
+        if options['baseline']:
+            self.compare(report, options['baseline'])
+
+    def log(self, message):
+        self.stderr.write(message)
+
+    def throwaway_database(self, stack):
+        """
+        Замеры идут в отдельной тестовой базе без внешней транзакции,
+        как в обычных запросах: работают run_parallel и on_commit.
+        Реплики отключены, они смотрят в настоящую базу.
+        """
+        media = tempfile.mkdtemp()
+        stack.callback(shutil.rmtree, media, ignore_errors=True)
+        stack.enter_context(override_settings(
+            MEDIA_ROOT=media, DATABASE_REPLICAS=[]
+        ))
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        stack.callback(
+            connection.creation.destroy_test_db, old_name, verbosity=0
+        )
+        stack.callback(close_pool_connections)
+        stack.callback(images.wait_for_variants)
+
+    def seed(self):
+        options = self.options
+        rng = self.rng
+        prefix = f'bench{options["seed"]}'
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(
+                f'Данные с префиксом {prefix} уже есть в базе'
+            )
+        started = time.monotonic()
+        call_command('basefill', path=options['path'], stdout=self.stderr)
+        self.ingredients = ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if len(ingredients) < 2:
+            raise CommandError('Нет ингредиентов для рецептов')
+        password = make_password('benchmark')
+        User.objects.bulk_create(
+            (User(username=f'{prefix}-{i}', email=f'{prefix}-{i}@bench.ru',
+                  first_name='Бенч', last_name=str(i), password=password)
+             for i in range(options['users'])),
+            batch_size=BATCH_SIZE
+        )
+        self.users = list(User.objects.filter(
+            username__startswith=f'{prefix}-'
+        ).order_by('id'))
+        for user in self.users:
+            Token.objects.create(user=user)
+        colors = rng.sample(range(0x1000000), options['tags'])
+        Tag.objects.bulk_create(
+            Tag(name=f'{prefix} {i}', color=f'#{color:06x}',
+                slug=f'{prefix}-{i}')
+            for i, color in enumerate(colors)
+        )
+        self.tags = dict(Tag.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).values_list('slug', 'id'))
+        tag_ids = list(self.tags.values())
+        Recipe.objects.bulk_create(
+            (Recipe(author=rng.choice(self.users), name=f'Рецепт {i}',
+                    text=f'Синтетический рецепт номер {i}',
+                    image='recipes/benchmark.png',
+                    cooking_time=rng.randint(1, 180))
+             for i in range(options['recipes'])),
+            batch_size=BATCH_SIZE
+        )
+        self.recipes = list(Recipe.objects.filter(
+            author__in=self.users
+        ).order_by('id').values_list('id', flat=True))
+        per_recipe = min(options['ingredients_per_recipe'], len(ingredients))
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                              amount=rng.randint(1, 500))
+             for recipe in self.recipes
+             for ingredient in rng.sample(ingredients, per_recipe)),
+            batch_size=BATCH_SIZE
+        )
+        TagsRecipes.objects.bulk_create(
+            (TagsRecipes(recipes_id=recipe, tags_id=tag)
+             for recipe in self.recipes
+             for tag in rng.sample(tag_ids, min(2, len(tag_ids)))),
+            batch_size=BATCH_SIZE
+        )
+        for model, field, per_user, choices in (
+            (Favorite, 'recipe_id', options['favorites'], self.recipes),
+            (ShoppingCart, 'recipe_id', options['carts'], self.recipes),
+            (Subscriptions, 'author_id', options['subscriptions'],
+             [user.id for user in self.users]),
+        ):
+            size = min(per_user, len(choices))
+            model.objects.bulk_create(
+                (model(user=user, **{field: value})
+                 for user in self.users
+                 for value in rng.sample(choices, size)
+                 if value != user.id or model is not Subscriptions),
+                batch_size=BATCH_SIZE
+            )
+        call_command('reconcile_counters', stdout=self.stderr)
+        call_command('rebuild_shopping_lists', stdout=self.stderr)
+        call_command('rebuild_search_index', stdout=self.stderr)
+        for user_id, author_id in Subscriptions.objects.filter(
+            user__in=self.users
+        ).values_list('user_id', 'author_id'):
+            feed.backfill(user_id, author_id)
+        self.log(
+            f'Данные созданы за {time.monotonic() - started:.1f} с: '
+            f'{len(self.users)} пользователей, {len(self.recipes)} рецептов'
+        )
+
+    def client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {user.auth_token.key}')
+        return client
+
+    def scenarios(self):
+        """Пары (имя, функция), функция возвращает (метод, url, тело)."""
+        rng = self.rng
+        numbers = count()
+
+        def recipe_payload():
+            return {
+                'name': f'Бенчмарк {next(numbers)}',
+                'text': 'Рецепт из бенчмарка',
+                'cooking_time': rng.randint(1, 180),
+                'image': IMAGE,
+                'tags': rng.sample(list(self.tags.values()), 1),
+                'ingredients': [
+                    {'id': ingredient, 'amount': rng.randint(1, 500)}
+                    for ingredient in rng.sample(self.ingredients, 2)
+                ],
+            }
+
+        def own_recipe(user):
+            recipe = user.recipes.order_by('?').values_list(
+                'id', flat=True
+            ).first()
+            return recipe or rng.choice(self.recipes)
+
+        return [
+            ('recipes-list', lambda user: (
+                'get', f'/api/recipes/?page={rng.randint(1, 5)}', None)),
+            ('recipes-list-tags', lambda user: (
+                'get', '/api/recipes/?' + '&'.join(
+                    f'tags={slug}' for slug in rng.sample(list(self.tags), 2)
+                ), None)),
+            ('recipes-list-author', lambda user: (
+                'get', f'/api/recipes/?author={rng.choice(self.users).id}',
+                None)),
+            ('recipes-list-favorited', lambda user: (
+                'get', '/api/recipes/?is_favorited=1', None)),
+            ('recipes-list-in-cart', lambda user: (
+                'get', '/api/recipes/?is_in_shopping_cart=1', None)),
+            ('recipes-search', lambda user: (
+                'get', '/api/recipes/?search=рецепт', None)),
+            ('recipe-detail', lambda user: (
+                'get', f'/api/recipes/{rng.choice(self.recipes)}/', None)),
+            ('recipe-create', lambda user: (
+                'post', '/api/recipes/', recipe_payload())),
+            ('recipe-patch', lambda user: (
+                'patch', f'/api/recipes/{own_recipe(user)}/',
+                recipe_payload())),
+            ('favorite-toggle', lambda user: (
+                'toggle', f'/api/recipes/{rng.choice(self.recipes)}/'
+                'favorite/', None)),
+            ('cart-toggle', lambda user: (
+                'toggle', f'/api/recipes/{rng.choice(self.recipes)}/'
+                'shopping_cart/', None)),
+            ('download-shopping-cart', lambda user: (
+                'get', '/api/recipes/download_shopping_cart/', None)),
+            ('subscriptions', lambda user: (
+                'get', '/api/users/subscriptions/?recipes_limit=3', None)),
+            ('ingredient-search', lambda user: (
+                'get', '/api/ingredients/?name=' + rng.choice(
+                    ['а', 'мо', 'сах', 'кар', 'со']
+                ), None)),
+        ]
+
+    def request(self, client, method, url, data):
+        """
+        Один замер: время, число запросов, из них INSERT/UPDATE/DELETE,
+        и код ответа. Счётчик запроса подхватывают MetricsMiddleware и
+        потоки run_parallel; записи идут в потоке запроса.
+        """
+        counter = QueryCounter()
+        token = request_queries.set(counter)
+        try:
+            with counting(), CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data, format='json')
+                if hasattr(response, 'streaming_content'):
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+        finally:
+            request_queries.reset(token)
+        writes = sum(
+            query['sql'].lstrip().upper().startswith(WRITES)
+            for query in queries
+        )
+        return elapsed, counter.queries, writes, response.status_code
+
+    def run(self):
+        clients = {user.id: self.client(user) for user in self.users}
+        report = {'options': {
+            key: self.options[key] for key in (
+                'users', 'recipes', 'tags', 'ingredients_per_recipe',
+                'favorites', 'carts', 'subscriptions', 'requests', 'seed',
+            )
+        }, 'scenarios': {}}
+        report['options']['db_threads'] = settings.DB_THREADS
+        for name, build in self.scenarios():
+            timings, counts, writes, errors = [], [], [], 0
+            for _ in range(self.options['requests']):
+                user = self.rng.choice(self.users)
+                method, url, data = build(user)
+                client = clients[user.id]
+                if method == 'toggle':
+                    measured = [
+                        self.request(client, 'post', url, None),
+                        self.request(client, 'delete', url, None),
+                    ]
+                else:
+                    measured = [self.request(client, method, url, data)]
+                for elapsed, queries, written, status in measured:
+                    timings.append(elapsed * 1000)
+                    counts.append(queries)
+                    writes.append(written)
+                    errors += status >= 400
+            report['scenarios'][name] = {
+                'requests': len(timings),
+                'errors': errors,
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+                'queries_mean': round(sum(counts) / len(counts), 2),
+                'queries_max': max(counts),
+                'writes_mean': round(sum(writes) / len(writes), 2),
+                'writes_max': max(writes),
+            }
+            self.log(f'{name}: {report["scenarios"][name]}')
+        return report
+
+    def compare(self, report, path):
+        """
+        Сравниваем p95, число запросов и записей с сохранённым отчётом.
+        """
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['scenarios']
+        regressions = []
+        for name, current in report['scenarios'].items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            ratio = current['p95_ms'] / max(previous['p95_ms'], 0.01)
+            self.log(
+                f'{name}: p95 {previous["p95_ms"]} -> {current["p95_ms"]} мс '
+                f'({ratio:.2f}x), запросов {previous["queries_max"]} -> '
+                f'{current["queries_max"]}, записей '
+                f'{previous.get("writes_mean", "-")} -> '
+                f'{current["writes_mean"]}'
+            )
+            if ratio > 1 + self.options['tolerance']:
+                regressions.append(f'{name}: p95 {ratio:.2f}x')
+            if current['queries_max'] > previous['queries_max']:
+                regressions.append(
+                    f'{name}: запросов {current["queries_max"]}'
+                )
+            if current['writes_max'] > previous.get(
+                'writes_max', current['writes_max']
+            ):
+                regressions.append(
+                    f'{name}: записей {current["writes_max"]}'
+                )
+        if regressions:
+            raise CommandError('Регрессии: ' + ', '.join(regressions))
+        self.log(self.style.SUCCESS('Регрессий нет'))
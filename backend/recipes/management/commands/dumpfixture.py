@@ -0,0 +1,44 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from recipes.fixture_stream import dump, sorted_models
+
+
+class Command(BaseCommand):
+    help = 'Dumps the database to a dumpdata-compatible JSON fixture'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'labels', nargs='*',
+            help='app_label or app_label.Model to dump, all by default',
+        )
+        parser.add_argument(
+            '-e', '--exclude',
+            action='append',
+            default=[],
+            help='app_label or app_label.Model to skip',
+        )
+        parser.add_argument('-o', '--output', help='File to write to')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Objects read per query',
+        )
+
+    def handle(self, *args, **options):
+        models = sorted_models(options['labels'], options['exclude'])
+        if not models:
+            raise CommandError('Нет моделей для выгрузки')
+        started = time.monotonic()
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                dump(stream, models, options['batch_size'])
+        else:
+            self.stdout.ending = ''
+            dump(self.stdout, models, options['batch_size'])
+        self.stderr.write(
+            f'Выгружено моделей: {len(models)} '
+            f'за {time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,134 @@
+import time
+from collections import Counter
+
+from django.core.management import BaseCommand, CommandError, call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from api.response_cache import response_cache
+from recipes import feed
+from recipes.fixture_stream import deserialize, sorted_models
+from users.models import Subscriptions
+
+
+class Command(BaseCommand):
+    help = 'Loads a dumpdata JSON fixture in batches with bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON fixture, e.g. dump.json')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Objects of one model inserted per query',
+        )
+        parser.add_argument(
+            '--skip-derived',
+            action='store_true',
+            help='Do not rebuild counters, shopping lists, search and feeds',
+        )
+
+    def handle(self, *args, **options):
+        self.loaded = Counter()
+        self.deferred = []
+        started = time.monotonic()
+        try:
+            file = open(options['path'], encoding='utf-8')
+        except OSError as error:
+            raise CommandError(error)
+        with file, transaction.atomic():
+            with connection.constraint_checks_disabled():
+                self.load(file, options['batch_size'])
+            self.check_loaded()
+            if not options['skip_derived']:
+                self.rebuild_derived()
+        # Сигналы об изменениях не отправлялись: кеш ответов устарел
+        response_cache.clear()
+        for model, count in self.loaded.items():
+            self.stdout.write(f'{model._meta.label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено объектов: {sum(self.loaded.values())} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
+
+    def load(self, file, batch_size):
+        """Объекты копятся по моделям и пишутся пачками batch_size."""
+        batches = {}
+        for item in deserialize(file):
+            batch = batches.setdefault(type(item.object), [])
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self.flush(batch)
+                batch.clear()
+        for model in sorted_models():
+            if batches.get(model):
+                self.flush(batches[model])
+        for item in self.deferred:
+            item.save_deferred_fields()
+
+    def check_loaded(self):
+        """Проверяем ссылки загруженных таблиц и сдвигаем sequences."""
+        models = list(self.loaded)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in models]
+        )
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+
+    def flush(self, batch):
+        """
+        Новые объекты вставляются bulk_create, уже существующие pk
+        обновляются bulk_update, как при save() в loaddata.
+        """
+        model = type(batch[0].object)
+        manager = model._default_manager
+        objects = [item.object for item in batch]
+        existing = set(manager.filter(
+            pk__in=[obj.pk for obj in objects if obj.pk is not None]
+        ).values_list('pk', flat=True))
+        new = [obj for obj in objects if obj.pk not in existing]
+        old = [obj for obj in objects if obj.pk in existing]
+        manager.bulk_create(new)
+        if old:
+            fields = [
+                field for field in model._meta.concrete_fields
+                if not field.primary_key
+            ]
+            for obj in old:
+                for field in fields:
+                    setattr(obj, field.attname, field.pre_save(obj, False))
+            manager.bulk_update(old, [field.name for field in fields])
+        self.set_m2m(model, batch)
+        self.deferred += [item for item in batch if item.deferred_fields]
+        self.loaded[model] += len(batch)
+
+    def set_m2m(self, model, batch):
+        """Связи many-to-many заменяются целиком, как в loaddata."""
+        for name in {name for item in batch for name in item.m2m_data}:
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            items = [item for item in batch if name in item.m2m_data]
+            through.objects.filter(**{
+                f'{source}__in': [item.object.pk for item in items]
+            }).delete()
+            through.objects.bulk_create(
+                through(**{source: item.object.pk, target: value})
+                for item in items
+                for value in item.m2m_data[name]
+            )
+
+    def rebuild_derived(self):
+        """bulk_create не шлёт сигналы: пересобираем производные данные."""
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        for user_id, author_id in Subscriptions.objects.values_list(
+            'user_id', 'author_id'
+        ).iterator():
+            feed.backfill(user_id, author_id)
+        self.stdout.write('Ленты подписок заполнены')
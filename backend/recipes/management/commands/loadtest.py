@@ -0,0 +1,122 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management import BaseCommand, CommandError
+
+from .benchmark import percentile
+
+PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/recipes/{recipe}/',
+    '/api/tags/',
+    '/api/ingredients/?name=са',
+    '/api/users/subscriptions/?recipes_limit=3',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads a running server with concurrent clients; '
+        'used to compare the WSGI and ASGI deployments'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Server address',
+        )
+        parser.add_argument('--token', help='Auth token for the requests')
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help='Simultaneous clients',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests per path',
+        )
+        parser.add_argument('--output', help='Write the report to a file')
+        parser.add_argument(
+            '--baseline',
+            help='Report of another run, e.g. the WSGI one, to compare with',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        self.headers = headers
+        status, body = self.fetch('/api/recipes/?limit=1')
+        if status != 200:
+            raise CommandError(f'Сервер ответил {status}')
+        results = json.loads(body)['results']
+        recipe = results[0]['id'] if results else 1
+        paths = [path.format(recipe=recipe) for path in PATHS]
+        if not options['token']:
+            paths = [path for path in paths if 'subscriptions' not in path]
+        report = {'options': {
+            key: options[key] for key in ('url', 'concurrency', 'requests')
+        }, 'paths': {}}
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            for path in paths:
+                report['paths'][path] = self.load(executor, path)
+                self.stderr.write(f'{path}: {report["paths"][path]}')
+        data = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(data)
+        else:
+            self.stdout.write(data)
+        if options['baseline']:
+            self.compare(report)
+
+    def fetch(self, path):
+        request = Request(
+            self.options['url'] + quote(path, safe='/?=&%'),
+            headers=self.headers
+        )
+        try:
+            with urlopen(request) as response:
+                return response.status, response.read()
+        except HTTPError as error:
+            return error.code, error.read()
+        except URLError as error:
+            raise CommandError(f'Сервер недоступен: {error.reason}')
+
+    def timed(self, path):
+        started = time.perf_counter()
+        status, _ = self.fetch(path)
+        return time.perf_counter() - started, status
+
+    def load(self, executor, path):
+        started = time.perf_counter()
+        measured = list(executor.map(
+            self.timed, [path] * self.options['requests']
+        ))
+        elapsed = time.perf_counter() - started
+        timings = [seconds * 1000 for seconds, _ in measured]
+        return {
+            'requests': len(measured),
+            'errors': sum(status >= 400 for _, status in measured),
+            'rps': round(len(measured) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+        }
+
+    def compare(self, report):
+        with open(self.options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)['paths']
+        for path, current in report['paths'].items():
+            previous = baseline.get(path)
+            if previous is None:
+                continue
+            self.stderr.write(
+                f'{path}: {previous["rps"]} -> {current["rps"]} запросов/с, '
+                f'p95 {previous["p95_ms"]} -> {current["p95_ms"]} мс'
+            )
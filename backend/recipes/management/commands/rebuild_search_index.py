@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import index_recipes
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the recipe search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Recipes indexed per transaction',
+        )
+
+    def handle(self, *args, **options):
+        ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            index_recipes(ids[start:start + batch_size])
+            self.stdout.write(
+                f'Проиндексировано {min(start + batch_size, len(ids))}'
+                f' из {len(ids)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
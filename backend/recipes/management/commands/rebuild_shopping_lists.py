@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds shopping list totals and verifies them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare stored totals with the live aggregation',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            count = shopping_list.rebuild()
+            self.stdout.write(f'Пересобрано позиций: {count}')
+        live = shopping_list.live_totals()
+        stored = shopping_list.stored_totals()
+        mismatched = sorted(
+            key for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        )
+        for user_id, ingredient_id in mismatched[:20]:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'{stored.get((user_id, ingredient_id))} != '
+                f'{live.get((user_id, ingredient_id))}'
+            )
+        if mismatched:
+            raise CommandError(f'Расхождений: {len(mismatched)}')
+        self.stdout.write(self.style.SUCCESS('Списки покупок сходятся'))
@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+
+def actual_count(model):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            count=Count('id')
+        ).values('count')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Repairs favorites_count and in_carts_count drift'
+
+    def handle(self, *args, **kwargs):
+        drifted = Recipe.objects.annotate(
+            actual_favorites=actual_count(Favorite),
+            actual_in_carts=actual_count(ShoppingCart),
+        ).filter(
+            ~Q(favorites_count=F('actual_favorites'))
+            | ~Q(in_carts_count=F('actual_in_carts'))
+        ).values_list('id', flat=True)
+        ids = list(drifted)
+        Recipe.objects.filter(id__in=ids).update(
+            favorites_count=actual_count(Favorite),
+            in_carts_count=actual_count(ShoppingCart),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Исправлено рецептов: {len(ids)}')
+        )
@@ -81,6 +81,12 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='recipes/'
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления',
         validators=(
@@ -106,11 +112,32 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name='Теги',
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-favorites_count', '-id'],
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=['-in_carts_count', '-id'],
+                         name='recipe_in_carts_count_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -239,3 +266,103 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe} добавлен(а) {self.user} в Список покупок'
+
+
+class ShoppingListItem(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        ordering = ('user', 'ingredient')
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_user_ingredient_list')
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.total_amount} ({self.user})'
+
+
+class RecipeSearchTerm(models.Model):
+    """Обратный индекс для поиска: основа слова и её вес в рецепте."""
+    term = models.CharField(
+        verbose_name='Основа слова',
+        max_length=100
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name='Рецепт'
+    )
+    weight = models.PositiveSmallIntegerField(
+        verbose_name='Вес'
+    )
+
+    class Meta:
+        ordering = ('term',)
+        verbose_name = 'Термин поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'recipe'],
+                                    name='unique_term_recipe')
+        ]
+
+    def __str__(self):
+        return f'{self.term} ({self.recipe_id}): {self.weight}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        ordering = ('user', '-recipe')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_user_recipe_feed')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-recipe'],
+                         name='feed_user_recipe_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -0,0 +1,169 @@
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+from .commit_batch import CommitBatch
+from .models import Recipe, RecipeSearchTerm
+
+NAME_WEIGHT = 3
+INGREDIENT_WEIGHT = 2
+TEXT_WEIGHT = 1
+MAX_WEIGHT = 32000
+MAX_TERM_LENGTH = 100
+
+STOP_WORDS = frozenset((
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а',
+    'то', 'все', 'она', 'так', 'его', 'но', 'да', 'ты', 'к', 'у', 'же',
+    'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было', 'вот', 'от',
+    'меня', 'еще', 'нет', 'о', 'из', 'ему', 'ли', 'если', 'или', 'ни',
+    'до', 'для', 'мы', 'их', 'чем', 'при', 'без', 'под', 'над', 'это',
+))
+
+VOWELS = 'аеиоуыэюя'
+PERFECTIVE_GERUND = re.compile(
+    r'(ив|ивши|ившись|ыв|ывши|ывшись|(?<=[ая])(в|вши|вшись))$'
+)
+REFLEXIVE = re.compile(r'(ся|сь)$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'(ивш|ывш|ующ|(?<=[ая])(ем|нн|вш|ющ|щ))$')
+VERB = re.compile(
+    r'(ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю|'
+    r'(?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+WORD = re.compile(r'\w+')
+
+
+def region_start(word, start=0):
+    """Начало области после первой пары «гласная + согласная»."""
+    for index in range(start + 1, len(word)):
+        if word[index - 1] in VOWELS and word[index] not in VOWELS:
+            return index + 1
+    return len(word)
+
+
+def strip(pattern, word):
+    return pattern.sub('', word, count=1)
+
+
+def stem(word):
+    """Стеммер Портера (Snowball) для русского языка."""
+    word = word.replace('ё', 'е')
+    rv_start = next(
+        (index + 1 for index, char in enumerate(word) if char in VOWELS),
+        len(word)
+    )
+    r2_start = region_start(word, region_start(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    result = strip(PERFECTIVE_GERUND, rv)
+    if result == rv:
+        rv = strip(REFLEXIVE, rv)
+        result = strip(ADJECTIVE, rv)
+        if result != rv:
+            result = strip(PARTICIPLE, result)
+        else:
+            result = strip(VERB, rv)
+            if result == rv:
+                result = strip(NOUN, rv)
+    rv = result
+
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    match = DERIVATIONAL.search(rv)
+    if match and rv_start + match.start() >= r2_start:
+        rv = rv[:match.start()]
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        result = strip(SUPERLATIVE, rv)
+        if result != rv:
+            rv = result[:-1] if result.endswith('нн') else result
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text):
+    """Основы слов текста без стоп-слов, в порядке появления."""
+    return [
+        stem(word)[:MAX_TERM_LENGTH]
+        for word in WORD.findall(text.casefold())
+        if len(word) > 1 and word not in STOP_WORDS and not word.isdigit()
+    ]
+
+
+def recipe_terms(recipe):
+    weights = Counter()
+    for term in tokenize(recipe.name):
+        weights[term] += NAME_WEIGHT
+    for ingredient in recipe.ingredients.all():
+        for term in tokenize(ingredient.name):
+            weights[term] += INGREDIENT_WEIGHT
+    for term in tokenize(recipe.text):
+        weights[term] += TEXT_WEIGHT
+    return weights
+
+
+def index_recipes(recipe_ids):
+    """Пересчитываем термины рецептов целиком."""
+    recipe_ids = list(recipe_ids)
+    recipes = Recipe.objects.filter(
+        id__in=recipe_ids
+    ).prefetch_related('ingredients')
+    with transaction.atomic():
+        RecipeSearchTerm.objects.filter(recipe__in=recipe_ids).delete()
+        RecipeSearchTerm.objects.bulk_create(
+            (RecipeSearchTerm(recipe=recipe, term=term,
+                              weight=min(weight, MAX_WEIGHT))
+             for recipe in recipes
+             for term, weight in recipe_terms(recipe).items()),
+            batch_size=1000
+        )
+
+
+index_batch = CommitBatch(index_recipes)
+
+
+def schedule_index(recipe_ids):
+    """
+    Индексируем после коммита, когда состав рецепта уже записан,
+    каждый рецепт транзакции - один раз.
+    """
+    index_batch.add(recipe_ids)
+
+
+def search(queryset, query):
+    """
+    Рецепты, содержащие хотя бы одно слово запроса. Выше те,
+    где совпало больше слов, затем с большим суммарным весом.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return queryset.none()
+    matches = RecipeSearchTerm.objects.filter(
+        recipe=OuterRef('pk'), term__in=terms
+    ).order_by().values('recipe')
+    return queryset.filter(
+        id__in=RecipeSearchTerm.objects.filter(
+            term__in=terms
+        ).values('recipe')
+    ).annotate(
+        search_matched=Subquery(
+            matches.annotate(count=Count('term')).values('count')
+        ),
+        search_rank=Subquery(
+            matches.annotate(rank=Sum('weight')).values('rank')
+        ),
+    ).order_by('-search_matched', '-search_rank', '-id')
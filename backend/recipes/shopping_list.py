@@ -0,0 +1,192 @@
+import csv
+import json
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+
+from users.models import User
+
+from .models import (IngredientRecipe, Recipe, ShoppingCart,
+                     ShoppingListItem)
+
+
+def get_shopping_list(user):
+    """
+    Суммарное количество каждого ингредиента из рецептов
+    в списке покупок пользователя. Итоги уже лежат в ShoppingListItem,
+    это один запрос по индексу пользователя; строки читаются по мере
+    отдачи ответа.
+    """
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+        amount=F('total_amount')
+    ).order_by('name').iterator()
+
+
+def recipe_amounts(recipe_id):
+    return dict(IngredientRecipe.objects.filter(
+        recipe=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+def apply_delta(user_ids, delta):
+    """
+    Прибавляем delta ({ingredient_id: количество}) к спискам покупок
+    пользователей user_ids. Позиции с нулевым итогом удаляются.
+    """
+    delta = {key: value for key, value in delta.items() if value}
+    user_ids = list(user_ids)
+    if not user_ids or not delta:
+        return
+    with transaction.atomic():
+        list(User.objects.select_for_update().filter(
+            id__in=user_ids
+        ).values_list('id'))
+        items = ShoppingListItem.objects.filter(
+            user__in=user_ids, ingredient__in=delta
+        )
+        existing = set(items.values_list('user_id', 'ingredient_id'))
+        items.update(total_amount=Case(
+            *(When(ingredient_id=ingredient_id,
+                   then=F('total_amount') + amount)
+              for ingredient_id, amount in delta.items()),
+            default=F('total_amount')
+        ))
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(user_id=user_id,
+                             ingredient_id=ingredient_id,
+                             total_amount=amount)
+            for user_id in user_ids
+            for ingredient_id, amount in delta.items()
+            if amount > 0 and (user_id, ingredient_id) not in existing
+        )
+        ShoppingListItem.objects.filter(
+            user__in=user_ids, total_amount__lte=0
+        ).delete()
+
+
+def lock_recipe(recipe_id):
+    """
+    Правка состава рецепта и добавление его в корзину идут по
+    очереди: иначе добавление прочитает старый состав, а правка не
+    увидит новую корзину, и список покупок разойдётся навсегда.
+    Блокировку берём до чтения состава и корзин и держим до коммита.
+    """
+    list(Recipe.objects.select_for_update().filter(
+        id=recipe_id
+    ).values_list('id'))
+
+
+def add_recipe(user_id, recipe_id):
+    with transaction.atomic():
+        lock_recipe(recipe_id)
+        apply_delta([user_id], recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    with transaction.atomic():
+        lock_recipe(recipe_id)
+        apply_delta([user_id], {
+            ingredient_id: -amount
+            for ingredient_id, amount in recipe_amounts(recipe_id).items()
+        })
+
+
+def update_recipe(recipe_id, old_amounts, new_amounts):
+    """
+    Переносим изменение состава рецепта во все списки с ним.
+    old_amounts читаются уже под lock_recipe.
+    """
+    delta = {
+        ingredient_id: (new_amounts.get(ingredient_id, 0)
+                        - old_amounts.get(ingredient_id, 0))
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    apply_delta(ShoppingCart.objects.filter(
+        recipe=recipe_id
+    ).values_list('user_id', flat=True), delta)
+
+
+def live_totals(user_ids=None):
+    """Итоги, посчитанные заново по ShoppingCart и IngredientRecipe."""
+    queryset = IngredientRecipe.objects.filter(
+        recipe__shopping_cart__isnull=False
+    )
+    if user_ids is not None:
+        queryset = queryset.filter(recipe__shopping_cart__user__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in queryset.values_list(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by().iterator()
+    }
+
+
+def stored_totals(user_ids=None):
+    queryset = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in queryset.values_list(
+            'user_id', 'ingredient_id', 'total_amount'
+        ).order_by().iterator()
+    }
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    """Пересобираем ShoppingListItem из живой агрегации."""
+    with transaction.atomic():
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            items = items.filter(user__in=user_ids)
+        items.delete()
+        totals = live_totals(user_ids)
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user_id,
+                              ingredient_id=ingredient_id,
+                              total_amount=total)
+             for (user_id, ingredient_id), total in totals.items()),
+            batch_size=batch_size
+        )
+    return len(totals)
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу отдаёт строку."""
+    def write(self, value):
+        return value
+
+
+def render_txt(items):
+    yield 'Cписок покупок:\n'
+    for item in items:
+        yield (f'{item["name"]} - {item["amount"]}'
+               f' {item["measurement_unit"]}\n')
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for item in items:
+        yield writer.writerow(
+            (item['name'], item['amount'], item['measurement_unit'])
+        )
+
+
+def render_json(items):
+    yield '['
+    for index, item in enumerate(items):
+        yield (',' if index else '') + json.dumps(item, ensure_ascii=False)
+    yield ']'
+
+
+RENDERERS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json; charset=utf-8'),
+}
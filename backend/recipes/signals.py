@@ -0,0 +1,167 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Subscriptions, User, login_only
+
+from . import feed
+from .commit_batch import CommitBatch
+from .images import delete_image_files, schedule_variants
+from .ingredient_index import ingredient_index
+from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, Tag, TagsRecipes)
+from .search import schedule_index
+from .shopping_list import lock_recipe, recipe_amounts, update_recipe
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(instance, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(instance, **kwargs):
+    lock_recipe(instance.id)
+    update_recipe(instance.id, recipe_amounts(instance.id), {})
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(instance, **kwargs):
+    """Нарезаем варианты, если изображение новое или сменилось."""
+    variants = instance.image_variants or {}
+    if instance.image and variants.get('source') != instance.image.name:
+        schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image(instance, **kwargs):
+    """Файлы изображения удалённого рецепта убираем после коммита."""
+    image_name, variants = instance.image.name, instance.image_variants
+    transaction.on_commit(lambda: delete_image_files(image_name, variants))
+
+
+def touch_recipes(recipes):
+    """Сдвигаем updated_at рецептов, чьё представление изменилось."""
+    Recipe.objects.filter(id__in=recipes).update(updated_at=timezone.now())
+
+
+# Рецепты, чей updated_at в текущей транзакции уже сдвинут
+touched = CommitBatch(lambda recipes: None)
+
+
+def touch_once(recipe_ids):
+    """
+    Строки состава и тегов меняются пачками: сдвигаем updated_at
+    рецепта один раз за транзакцию.
+    """
+    recipe_ids = touched.add(recipe_ids)
+    if recipe_ids:
+        touch_recipes(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def mark_saved_recipe(instance, update_fields=None, **kwargs):
+    """Сохранение рецепта само сдвигает updated_at (auto_now)."""
+    if not update_fields or 'updated_at' in update_fields:
+        touched.add([instance.id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+def touch_related_recipes(instance, **kwargs):
+    touch_recipes(instance.recipes.all())
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, update_fields=None, **kwargs):
+    """Рецепты показывают автора; вход их не меняет."""
+    if login_only(update_fields):
+        return
+    touch_recipes(instance.recipes.all())
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def touch_ingredient_recipe(instance, **kwargs):
+    touch_once([instance.recipe_id])
+
+
+@receiver((post_save, post_delete), sender=TagsRecipes)
+def touch_tag_recipe(instance, **kwargs):
+    touch_once([instance.recipes_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_retagged_recipes(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_once([instance.pk])
+    elif pk_set:
+        touch_once(pk_set)
+
+
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(instance, **kwargs):
+    schedule_index([instance.id])
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def index_recipe_ingredients(instance, **kwargs):
+    schedule_index([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(instance, **kwargs):
+    schedule_index(instance.recipes.values_list('id', flat=True))
+
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def change_counter(sender, recipe_id, delta):
+    """
+    Атомарно меняем счётчик рецепта; updated_at сдвигается,
+    чтобы ETag рецепта учитывал новое значение.
+    """
+    field = COUNTERS[sender]
+    Recipe.objects.filter(id=recipe_id).update(**{
+        field: Greatest(F(field) + delta, 0),
+        'updated_at': timezone.now(),
+    })
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(sender, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_counter(sender, instance, **kwargs):
+    change_counter(sender, instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def add_to_feeds(instance, created, **kwargs):
+    if created and instance.author_id:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscriptions)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscriptions)
+def prune_feed(instance, **kwargs):
+    feed.prune(instance.user_id, instance.author_id)
@@ -0,0 +1,195 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from users.models import User
+
+from .coverage_index import CoverageIndex
+from .images import VARIANTS
+from .search import index_recipes, search, stem, tokenize
+from .models import Ingredient, IngredientRecipe, Recipe
+
+
+class CoverageIndexTest(TestCase):
+    """Индекс «что приготовить» догоняет изменения других процессов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Автор', last_name='Рецептов'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.index = CoverageIndex(0, 300)
+
+    def create_recipe(self, ingredients):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='recipes/test.png', cooking_time=10
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def recipes(self, ingredient):
+        return {
+            recipe_id
+            for _, _, recipe_id in self.index.query([ingredient.id])
+        }
+
+    def commit_late(self, recipe, before):
+        """Транзакция записала updated_at раньше, чем закоммитилась."""
+        Recipe.objects.filter(id=recipe.id).update(
+            updated_at=before.updated_at - timedelta(minutes=1)
+        )
+
+    def test_late_commit_of_new_recipe(self):
+        first = self.create_recipe(self.ingredients[:2])
+        self.assertEqual(self.recipes(self.ingredients[0]), {first.id})
+        late = self.create_recipe(self.ingredients[:1])
+        self.commit_late(late, first)
+        self.assertEqual(
+            self.recipes(self.ingredients[0]), {first.id, late.id}
+        )
+
+    def test_late_commit_of_edit_after_rebuild(self):
+        first = self.create_recipe(self.ingredients[:2])
+        edited = self.create_recipe(self.ingredients[:1])
+        self.recipes(self.ingredients[0])
+        IngredientRecipe.objects.create(
+            recipe=edited, ingredient=self.ingredients[2], amount=1
+        )
+        self.commit_late(edited, first)
+        self.index.timeout = 0
+        self.assertEqual(self.recipes(self.ingredients[2]), {edited.id})
+
+    def test_deleted_recipe(self):
+        kept = self.create_recipe(self.ingredients[:1])
+        deleted = self.create_recipe(self.ingredients[:1])
+        self.recipes(self.ingredients[0])
+        deleted.delete()
+        self.assertEqual(self.recipes(self.ingredients[0]), {kept.id})
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name=f'{color}.png')
+
+
+class RecipeImageFilesTest(TransactionTestCase):
+    """Файлы вытесненных изображений не остаются в хранилище."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media, IMAGE_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Автор', last_name='Рецептов'
+        )
+
+    @staticmethod
+    def files(recipe):
+        recipe.refresh_from_db()
+        variants = recipe.image_variants
+        names = {recipe.image.name}
+        for variant in VARIANTS:
+            names.update(variants[variant].values())
+        return names
+
+    @staticmethod
+    def stored(names):
+        return {name for name in names if default_storage.exists(name)}
+
+    def test_replaced_image_is_deleted(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image=png('red'), cooking_time=10
+        )
+        first = self.files(recipe)
+        self.assertEqual(len(first), 1 + len(VARIANTS) * 2)
+        for color in ('green', 'blue'):
+            recipe.refresh_from_db()
+            recipe.image = png(color)
+            recipe.save()
+        current = self.files(recipe)
+        self.assertEqual(self.stored(current), current)
+        self.assertEqual(self.stored(first), set())
+        recipe.delete()
+        self.assertEqual(self.stored(current), set())
+
+
+class SearchTest(TestCase):
+    """Поиск находит словоформы и ранжирует по числу слов и весу."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Автор', last_name='Рецептов'
+        )
+        potato = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+        cls.both_in_name = cls.create_recipe('Курица с картофелем')
+        cls.both = cls.create_recipe('Курица', ingredients=[potato])
+        cls.name_only = cls.create_recipe('Жареная курица')
+        cls.text_only = cls.create_recipe('Рагу', text='Тушим курицу')
+        cls.other = cls.create_recipe('Свёкла')
+        index_recipes(Recipe.objects.values_list('id', flat=True))
+
+    @classmethod
+    def create_recipe(cls, name, text='Текст', ingredients=()):
+        recipe = Recipe.objects.create(
+            author=cls.author, name=name, text=text,
+            image='recipes/test.png', cooking_time=10
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def test_stem(self):
+        for words, expected in (
+            (('курица', 'курицы', 'курицей'), 'куриц'),
+            (('картофель', 'картофелем'), 'картофел'),
+            (('жареная', 'жареный'), 'жарен'),
+            (('помидоры', 'помидоров'), 'помидор'),
+            (('свёкла', 'свекла'), 'свекл'),
+        ):
+            for word in words:
+                with self.subTest(word=word):
+                    self.assertEqual(stem(word), expected)
+
+    def test_tokenize_skips_stop_words_and_numbers(self):
+        self.assertEqual(
+            tokenize('Жареная Курица с картофелем и 2 помидорами'),
+            ['жарен', 'куриц', 'картофел', 'помидор']
+        )
+
+    def test_ranking(self):
+        found = search(Recipe.objects.all(), 'курицы и картофеля')
+        self.assertEqual(list(found), [
+            self.both_in_name, self.both, self.name_only, self.text_only
+        ])
+
+    def test_only_stop_words(self):
+        self.assertFalse(search(Recipe.objects.all(), 'и с по').exists())
@@ -0,0 +1,90 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    LRU-кеш токенов в памяти процесса с ограниченным временем жизни.
+    Запись помнит версию токена из общего для воркеров кеша alias и
+    на каждом чтении сверяет её: отзыв токена сбрасывает версию,
+    и все процессы сразу перестают принимать его из памяти.
+    """
+    def __init__(self, size, ttl, alias):
+        self.size = size
+        self.ttl = ttl
+        self.alias = alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def versions(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def version_key(key):
+        return f'token:{key}'
+
+    def version(self, key):
+        """
+        Версия токена; читается до запроса в базу, чтобы отзыв,
+        пришедший во время запроса, не остался незамеченным.
+        """
+        version_key = self.version_key(key)
+        self.versions.add(version_key, uuid.uuid4().hex, timeout=self.ttl)
+        return self.versions.get(version_key)
+
+    def get(self, key):
+        version = self.versions.get(self.version_key(key))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value, entry_version = entry
+            if expires < time.monotonic() or entry_version != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, version):
+        if version is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def revoke(self, keys):
+        """Сбрасываем версии после коммита, когда база уже изменена."""
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        version_keys = [self.version_key(key) for key in keys]
+        transaction.on_commit(lambda: self.versions.delete_many(version_keys))
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL, 'tokens'
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, которая не ходит в базу за известным токеном."""
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            version = token_cache.version(key)
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached, version)
+        user, token = cached
+        return copy.copy(user), token
@@ -33,6 +33,11 @@ class User(AbstractUser):
         return self.username
 
 
+def login_only(update_fields):
+    """Сохранение пользователя при входе меняет только last_login."""
+    return bool(update_fields) and set(update_fields) <= {'last_login'}
+
+
 class Subscriptions(models.Model):
     user = models.ForeignKey(
         User,
@@ -1,5 +1,3 @@
-from rest_framework.pagination import PageNumberPagination
+from api.pagination import CustomPaginator
 
-
-class CustomPaginator(PageNumberPagination):
-    page_size_query_param = 'limit'
+__all__ = ('CustomPaginator',)
@@ -1,6 +1,8 @@
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 
+from api.user_state import get_user_state
+
 from .models import User
 from .validators import (validate_email, validate_username,
                          validate_username_exists)
@@ -28,9 +30,9 @@ class CustomUserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return user.follower.filter(author=obj).exists()
+        request = self.context['request']
+        if request.user.is_authenticated:
+            return obj.id in get_user_state(request).following_ids
 
     class Meta:
         model = User
@@ -71,4 +73,6 @@ class SubscribeSerializer(CustomUserSerializer):
         return SubscribeCartSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .models import User, login_only
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    token_cache.revoke([instance.key])
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user_tokens(instance, update_fields=None, **kwargs):
+    if login_only(update_fields):
+        return
+    token_cache.revoke(
+        Token.objects.filter(user_id=instance.pk).values_list('key', flat=True)
+    )
@@ -0,0 +1,62 @@
+from django.test import TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import TokenCache, token_cache
+from .models import User
+
+
+class TokenRevocationTest(TransactionTestCase):
+    """
+    Изменения пользователя и выход сбрасывают кеш токенов во всех
+    процессах; второй экземпляр TokenCache играет роль другого воркера.
+    """
+
+    def setUp(self):
+        token_cache.versions.clear()
+        self.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password='pass',
+            first_name='Имя', last_name='Фамилия'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.me().status_code, 200)
+        self.worker = TokenCache(10, 60, 'tokens')
+        self.worker.set(
+            self.token.key, (self.user, self.token),
+            self.worker.version(self.token.key)
+        )
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def assert_revoked(self):
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertIsNone(self.worker.get(self.token.key))
+
+    def test_password_change(self):
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'pass', 'new_password': 'Nov0e-parol',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.assert_revoked()
+
+    def test_deactivation(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assert_revoked()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_logout(self):
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_revoked()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_login_keeps_tokens(self):
+        response = APIClient().post('/api/auth/token/login/', {
+            'email': 'user@foodgram.ru', 'password': 'pass',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(self.worker.get(self.token.key))
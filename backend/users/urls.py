@@ -2,6 +2,8 @@ from django.urls import include, path
 from rest_framework.authtoken import views
 from rest_framework.routers import DefaultRouter
 
+from api.concurrency import async_routes
+
 from .views import CustomUserViewset
 
 users_router = DefaultRouter()
@@ -9,7 +11,9 @@ users_router.register(r'users', CustomUserViewset, basename='users')
 
 
 urlpatterns = [
-    path('', include(users_router.urls)),
+    path('', include(
+        async_routes(users_router.urls, ('users-subscriptions',))
+    )),
     path('auth/', include('djoser.urls.authtoken')),
     path('api-token-auth/', views.obtain_auth_token),
 ]
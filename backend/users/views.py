@@ -1,3 +1,4 @@
+from django.db.models import Count, OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -5,6 +6,10 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api.concurrency import run_parallel
+from api.user_state import get_user_state
+from recipes.models import Recipe
+
 from .models import Subscriptions, User
 from .pagination import CustomPaginator
 from .serializers import SubscribeSerializer
@@ -13,6 +18,7 @@ from .serializers import SubscribeSerializer
 class CustomUserViewset(UserViewSet):
     http_method_names = ['get', 'post', 'delete']
     pagination_class = CustomPaginator
+    replica_reads = True
 
     @action(
         methods=['POST', 'DELETE'],
@@ -43,11 +49,36 @@ class CustomUserViewset(UserViewSet):
         detail=False,
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
-        pages = self.paginate_queryset(queryset)
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            recipes_count=Count('recipes', distinct=True),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=self.limited_recipes(request))
+        ).order_by('id')
+        pages, _ = run_parallel(
+            lambda: self.paginate_queryset(queryset),
+            lambda: get_user_state(request).following_ids,
+        )
         serializer = SubscribeSerializer(
             pages,
             many=True,
             context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
+
+    def limited_recipes(self, request):
+        """
+        Первые recipes_limit рецептов каждого автора одним запросом:
+        коррелированный подзапрос с LIMIT отбирает их для всех авторов
+        страницы сразу.
+        """
+        queryset = Recipe.objects.all()
+        limit = request.GET.get('recipes_limit')
+        if limit:
+            queryset = queryset.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('id')[:int(limit)]
+            ))
+        return queryset